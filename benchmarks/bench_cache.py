@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Requests per second of a validated listing endpoint, computed for each
+request, and served from the response cache.
+
+    python benchmarks/bench_cache.py
+"""
+
+import tempfile
+
+from zope.interface import Interface
+from zope.schema import ASCIILine, Int
+
+from dolmen.api_engine.cache import cached, MemoryBackend, FileBackend
+from dolmen.api_engine.responder import reply_json
+from dolmen.api_engine.validation import validate
+from common import consume, make_environ, measure, report
+
+
+class IQuery(Interface):
+    term = ASCIILine(title="Search term", required=True)
+    page = Int(title="Page", required=False, min=1)
+    size = Int(title="Page size", required=False, min=1, max=100)
+
+
+def search(environ, data):
+    start = ((data.page or 1) - 1) * (data.size or 20)
+    return reply_json(200, [
+        {'id': idx, 'username': '%s%d' % (data.term, idx)}
+        for idx in range(start, start + (data.size or 20))])
+
+
+def serve(action):
+    def application(environ, start_response):
+        return action(environ, None)(environ, start_response)
+    return application
+
+
+def main():
+    uncached = validate(IQuery, compiled=True)(search)
+    memory = validate(IQuery, compiled=True)(
+        cached(MemoryBackend())(search))
+    with tempfile.TemporaryDirectory() as directory:
+        files = validate(IQuery, compiled=True)(
+            cached(FileBackend(directory))(search))
+        query = 'term=user&page=3&size=50'
+        report('Listing of 50 users', [
+            (name, measure(lambda: consume(
+                serve(action), make_environ('/users', query=query))))
+            for name, action in (('uncached', uncached),
+                              ('memory backend', memory),
+                              ('file backend', files))])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Requests per second and body sizes of a JSON listing, sent as it is
+and compressed by the `compress` middleware.
+
+    python benchmarks/bench_compression.py
+"""
+
+from dolmen.api_engine.compression import compress, ENCODERS
+from dolmen.api_engine.responder import reply_json
+from common import make_environ, measure, start_response
+
+
+LISTING = [
+    {'id': idx, 'username': 'user%d' % idx, 'email': 'user%d@example.com'
+     % idx, 'groups': ['staff', 'editors'], 'active': bool(idx % 2)}
+    for idx in range(1000)]
+
+
+def listing(environ, start_response):
+    return reply_json(200, LISTING)(environ, start_response)
+
+
+def body_size(app, environ):
+    return sum(len(chunk) for chunk in app(environ, start_response))
+
+
+def main():
+    title = '1000 items listing'
+    print(title)
+    print('-' * len(title))
+    rows = [('identity', listing, None)]
+    for encoding in sorted(ENCODERS):
+        for level in (1, 6):
+            rows.append(('%s, level %d' % (encoding, level), compress(
+                level=level, encodings=(encoding,))(listing), encoding))
+    for name, app, encoding in rows:
+        extra = {'HTTP_ACCEPT_ENCODING': encoding} if encoding else {}
+        ops = measure(lambda: body_size(app, make_environ(**extra)))
+        size = body_size(app, make_environ(**extra))
+        print('  %-18s  %10.1f ops/s  %8d bytes' % (name, ops, size))
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Per request cost of a view stacked with authentication and validation.
+
+The `legacy` variants reproduce the former behavior, where each layer
+built its own `webob.Request` and the JSON body was decoded twice.
+
+    python benchmarks/bench_context.py
+"""
+
+import json
+from functools import wraps
+from urllib.parse import urlencode
+
+from webob import Request
+from zope.interface import Interface
+from zope.schema import ASCIILine, List
+
+from dolmen.api_engine.auth import authenticate
+from dolmen.api_engine.components import APIView, BaseOverhead
+from dolmen.api_engine.responder import reply
+from dolmen.api_engine.validation import validate, JSONSchema
+from common import consume, make_environ, measure, report
+
+
+class IUser(Interface):
+    username = ASCIILine(title="Username", required=True)
+    departments = List(title="Departments", value_type=ASCIILine())
+
+
+SCHEMA = JSONSchema.create_from_json({
+    'type': 'object',
+    'properties': {
+        'username': {'type': 'string'},
+        'departments': {'type': 'array', 'items': {'type': 'string'}},
+    },
+    'required': ['username'],
+})
+
+
+def check_token(authvalue, environ, conf):
+    return 200, authvalue
+
+
+class Overhead(BaseOverhead):
+
+    def set_data(self, data):
+        self.data = data
+
+
+def legacy_authenticate(checkers):
+    def wrapper(app):
+        def watchdog(environ, start_response):
+            auth = Request(environ).headers.get('Authorization')
+            authtype, authvalue = auth.split(' ', 1)
+            code, payload = checkers[authtype](authvalue, environ, {})
+            environ['auth_payload'] = payload
+            return app(environ, start_response)
+        return watchdog
+    return wrapper
+
+
+def legacy_validate(iface):
+    validator = validate(iface)
+
+    def extract(environ):
+        request = Request(environ)
+        return request.POST.dict_of_lists()
+
+    validator.extract = extract
+    return validator
+
+
+def legacy_json_validator(schema, method):
+    @wraps(method)
+    def validate_method(inst, environ, overhead):
+        request = Request(environ)
+        if request.content_type != 'application/json':
+            return reply(406)
+        errors = schema.validate(request.json)
+        if errors:
+            return reply(400, text=json.dumps(errors))
+        overhead.set_data(request.json)
+        return method(inst, environ, overhead)
+    return validate_method
+
+
+def make_form_app(auth, validator):
+    @validator(IUser)
+    def action(environ, data):
+        return reply(200, text=data.username)
+
+    @auth({'Token': check_token})
+    def app(environ, start_response):
+        return action(environ, None)(environ, start_response)
+    return app
+
+
+def make_json_app(auth, json_validator):
+
+    class View(APIView):
+
+        def POST(self, environ, overhead):
+            return reply(200, text=overhead.data['username'])
+
+    View.POST = json_validator(View.POST)
+    View.compile_dispatch()
+    view = View()
+
+    @auth({'Token': check_token})
+    def app(environ, start_response):
+        return view(environ, Overhead())(environ, start_response)
+    return app
+
+
+def main():
+    form = urlencode(
+        {'username': 'alice', 'departments': ['a', 'b', 'c']},
+        doseq=True).encode()
+    payload = json.dumps({
+        'username': 'alice', 'departments': ['d%d' % i for i in range(50)],
+    }).encode()
+    headers = {'HTTP_AUTHORIZATION': 'Token secret'}
+
+    def form_environ():
+        return make_environ(
+            method='POST', body=form,
+            content_type='application/x-www-form-urlencoded', **headers)
+
+    def json_environ():
+        return make_environ(
+            method='POST', body=payload,
+            content_type='application/json', **headers)
+
+    legacy_form = make_form_app(legacy_authenticate, legacy_validate)
+    shared_form = make_form_app(authenticate, validate)
+    legacy_json = make_json_app(
+        legacy_authenticate,
+        lambda method: legacy_json_validator(SCHEMA, method))
+    shared_json = make_json_app(authenticate, SCHEMA.json_validator)
+
+    report('Form POST, authentication + validate', [
+        ('legacy', measure(lambda: consume(legacy_form, form_environ()))),
+        ('context', measure(lambda: consume(shared_form, form_environ()))),
+    ])
+    report('JSON POST, authentication + json_validator', [
+        ('legacy', measure(lambda: consume(legacy_json, json_environ()))),
+        ('context', measure(lambda: consume(shared_json, json_environ()))),
+    ])
+
+
+if __name__ == '__main__':
+    main()
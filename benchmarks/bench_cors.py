@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Requests per second of CORS preflights, through the authentication and
+the node, and answered by the `cors` middleware.
+
+    python benchmarks/bench_cors.py
+"""
+
+from dolmen.api_engine.auth import authenticate
+from dolmen.api_engine.components import APIView
+from dolmen.api_engine.cors import CORSPolicy, cors
+from dolmen.api_engine.responder import static_reply
+from dolmen.api_engine.routing import RouterNode
+from common import consume, make_environ, measure, report
+
+
+class Users(APIView):
+
+    def GET(self, environ, overhead):
+        return static_reply(200)
+
+    def POST(self, environ, overhead):
+        return static_reply(201)
+
+
+def check_token(authvalue, environ, conf):
+    return (200, authvalue)
+
+
+def main():
+    node = RouterNode({'/users/{username}': Users()})
+    stack = authenticate({'Token': check_token})(node)
+    policy = CORSPolicy(origins=('https://app.example.com',),
+                        headers=('Content-Type',), max_age=600)
+    app = cors(policy, node)(stack)
+    extra = {'HTTP_ORIGIN': 'https://app.example.com',
+             'HTTP_ACCESS_CONTROL_REQUEST_METHOD': 'POST',
+             'HTTP_AUTHORIZATION': 'Token secret'}
+    report('Preflight', [
+        ('authenticated stack', measure(lambda: consume(
+            stack, make_environ('/users/ada', 'OPTIONS', **extra)))),
+        ('cors middleware', measure(lambda: consume(
+            app, make_environ('/users/ada', 'OPTIONS', **extra)))),
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Digest throughput over a batch of files of mixed sizes, per hash
+algorithm and number of threads.
+
+    python benchmarks/bench_digest.py
+"""
+
+import os
+import shutil
+import tempfile
+import time
+
+from dolmen.api_engine.upload import CHUNKSIZE, BUFFERSIZE, digest_files
+
+
+SIZES = [16 * 1024, 256 * 1024, 1024 * 1024, 8 * 1024 * 1024] * 8
+
+
+def make_files(directory):
+    paths = []
+    for idx, size in enumerate(SIZES):
+        path = os.path.join(directory, 'file%d' % idx)
+        with open(path, 'wb') as fd:
+            fd.write(os.urandom(size))
+        paths.append(path)
+    return paths
+
+
+def throughput(paths, **options):
+    fobjs = [open(path, 'rb') for path in paths]
+    try:
+        started = time.perf_counter()
+        digest_files(fobjs, **options)
+        elapsed = time.perf_counter() - started
+    finally:
+        for fobj in fobjs:
+            fobj.close()
+    return sum(SIZES) / elapsed / 1024 / 1024
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        paths = make_files(directory)
+        throughput(paths)  # Warms the page cache.
+        cores = os.cpu_count() or 1
+        workers = sorted(set((1, 2, 4, cores)))
+        print('%d files, %.1f MiB, %d cores' % (
+            len(SIZES), sum(SIZES) / 1024 / 1024, cores))
+        print()
+        print('  %-8s %-8s %s' % ('hash', 'buffer', '  '.join(
+            '%8s' % ('%d thr.' % count) for count in workers)))
+        for hash in ('sha1', 'sha256', 'blake2b'):
+            for chunk_size in (CHUNKSIZE, BUFFERSIZE):
+                rates = [
+                    throughput(paths, hash=hash, chunk_size=chunk_size,
+                               workers=count)
+                    for count in workers]
+                print('  %-8s %-8s %s MiB/s' % (
+                    hash, '%dK' % (chunk_size // 1024),
+                    '  '.join('%8.1f' % rate for rate in rates)))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
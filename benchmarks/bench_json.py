@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+Replies per second of a JSON listing, serialized by `json.dumps` and
+re-encoded by `reply`, and serialized to bytes by `reply_json`.
+
+    python benchmarks/bench_json.py
+"""
+
+import json
+
+from dolmen.api_engine.responder import (
+    dumps_orjson, orjson, reply, reply_json)
+from common import measure, report
+
+
+LISTING = [
+    {'id': idx, 'username': 'user%d' % idx, 'email': 'user%d@example.com'
+     % idx, 'groups': ['staff', 'editors'], 'active': bool(idx % 2)}
+    for idx in range(1000)]
+
+
+def main():
+    rows = [
+        ('json.dumps + reply', measure(lambda: reply(
+            200, text=json.dumps(LISTING),
+            content_type='application/json').body)),
+        ('reply_json (json)', measure(lambda: reply_json(
+            200, LISTING).body)),
+    ]
+    if orjson is not None:
+        rows.append(('reply_json (orjson)', measure(
+            lambda: reply_json(200, LISTING, serializer=dumps_orjson).body)))
+    report('1000 items listing', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput of `JSONSchema.validate` on valid and invalid payloads,
+compared with a validator built for each call.
+
+    python benchmarks/bench_jsonschema.py
+"""
+
+from jsonschema import Draft4Validator
+
+from dolmen.api_engine.validation import JSONSchema
+from common import measure, report
+
+
+SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'username': {'type': 'string', 'maxLength': 64},
+        'email': {'type': 'string', 'pattern': '^[^@]+@[^@]+$'},
+        'age': {'type': 'integer', 'minimum': 0},
+        'tags': {'type': 'array', 'items': {'type': 'string'}},
+    },
+    'required': ['username', 'email'],
+}
+
+VALID = {
+    'username': 'alice', 'email': 'alice@example.com', 'age': 30,
+    'tags': ['tag%d' % i for i in range(20)],
+}
+
+INVALID = {'username': 42, 'age': -1, 'tags': [1, 2]}
+
+
+def legacy_validate(schema, obj):
+    errors = {}
+    validator = Draft4Validator(schema)
+    for error in sorted(validator.iter_errors(obj), key=str):
+        errors.setdefault(tuple(error.path), []).append(error.message)
+    return errors
+
+
+def main():
+    schema = JSONSchema.create_from_json(SCHEMA)
+    for title, payload in (('Valid payload', VALID),
+                           ('Invalid payload', INVALID)):
+        report(title, [
+            ('validator per call',
+             measure(lambda: legacy_validate(SCHEMA, payload))),
+            ('compiled validator', measure(lambda: schema.validate(payload))),
+        ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Requests per second of a validated endpoint, without instrumentation
+hooks and with the `Metrics` histograms recording every stage.
+
+    python benchmarks/bench_metrics.py
+"""
+
+from zope.interface import Interface
+from zope.schema import ASCIILine, Int
+
+from dolmen.api_engine.metrics import Metrics, add_hook, remove_hook
+from dolmen.api_engine.responder import static_reply
+from dolmen.api_engine.routing import RouterNode
+from dolmen.api_engine.validation import validate
+from common import consume, make_environ, measure, report
+
+
+class IQuery(Interface):
+    term = ASCIILine(title="Search term", required=True)
+    page = Int(title="Page", required=False, min=1)
+
+
+@validate(IQuery, compiled=True)
+def search(environ, data):
+    return static_reply(200)
+
+
+def main():
+    node = RouterNode({'/users/{username}/search': search})
+    request = lambda: consume(node, make_environ(
+        '/users/ada/search', query='term=dolmen&page=2'))
+
+    rows = [('no hooks', measure(request))]
+    metrics = Metrics()
+    add_hook(metrics)
+    try:
+        rows.append(('metrics hook', measure(request)))
+    finally:
+        remove_hook(metrics)
+    report('Validated endpoint', rows)
+
+
+if __name__ == '__main__':
+    main()
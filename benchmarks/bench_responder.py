@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Requests per second of 404 and 405 floods, with replies created by
+WebOb for each request, and with the pre-rendered static replies.
+
+    python benchmarks/bench_responder.py
+"""
+
+from dolmen.api_engine.components import APIView, APINode
+from dolmen.api_engine.responder import reply, static_reply
+from common import consume, make_environ, measure, report
+
+
+class Node(APINode):
+
+    def __init__(self, views):
+        self.views = views
+
+    def lookup(self, path_info, environ):
+        return self.views.get(path_info)
+
+    def process_endpoint(self, environ, view):
+        return view(environ, None)
+
+
+class LegacyNode(Node):
+
+    def not_found(self, environ):
+        return reply(404, "Not found. Please consult the API documentation.")
+
+
+class View(APIView):
+
+    def GET(self, environ, overhead):
+        return static_reply(200)
+
+
+class LegacyView(View):
+
+    def __call__(self, environ, overhead):
+        worker = getattr(self, environ['REQUEST_METHOD'].upper(), None)
+        if worker is None:
+            return reply(405)
+        return worker(environ, overhead)
+
+
+def main():
+    legacy = LegacyNode({'/view': LegacyView()})
+    static = Node({'/view': View()})
+
+    report('404 flood', [
+        ('webob reply', measure(
+            lambda: consume(legacy, make_environ('/unknown')))),
+        ('static reply', measure(
+            lambda: consume(static, make_environ('/unknown')))),
+    ])
+    report('405 flood', [
+        ('webob reply', measure(
+            lambda: consume(legacy, make_environ('/view', 'POST')))),
+        ('static reply', measure(
+            lambda: consume(static, make_environ('/view', 'POST')))),
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the compiled router with a naive list of regular expressions,
+scanned linearly, as most hand written `APINode.lookup` do.
+
+    python benchmarks/bench_routing.py
+"""
+
+import re
+
+from dolmen.api_engine.routing import Router
+from common import measure, report
+
+
+def make_routes(count):
+    """Returns `count` routes, alternating lists and details, the last
+    one being a details route.
+    """
+    routes = {}
+    for idx in range(count):
+        if (count - idx) % 2:
+            routes['/resource%d/{id:int}/details' % idx] = 'details%d' % idx
+        else:
+            routes['/resource%d/list' % idx] = 'list%d' % idx
+    return routes
+
+
+def regex_table(routes):
+    table = []
+    for pattern, endpoint in routes.items():
+        regex = re.sub(r'{(\w+):int}', r'(?P<\1>\\d+)', pattern)
+        table.append((re.compile('^%s$' % regex), endpoint))
+    return table
+
+
+def regex_lookup(table, path):
+    for regex, endpoint in table:
+        match = regex.match(path)
+        if match is not None:
+            return endpoint, match.groupdict()
+    return None
+
+
+def main():
+    for count in (10, 100, 1000):
+        routes = make_routes(count)
+        router = Router(routes)
+        router.compile()
+        table = regex_table(routes)
+        # The worst case for the linear scan : the last declared route.
+        path = '/resource%d/42/details' % (count - 1)
+        assert router.match(path).endpoint == regex_lookup(table, path)[0]
+        report('%d routes' % count, [
+            ('regex list', measure(lambda: regex_lookup(table, path))),
+            ('radix tree', measure(lambda: router.match(path))),
+        ])
+
+
+if __name__ == '__main__':
+    main()
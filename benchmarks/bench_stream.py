@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Peak memory and time to first byte of a large JSON export, built as a
+list and replied at once, and streamed by `stream_json`.
+
+    python benchmarks/bench_stream.py [rows]
+"""
+
+import sys
+import time
+import tracemalloc
+
+from dolmen.api_engine.responder import reply_json, stream_json
+from common import make_environ, start_response
+
+
+def rows(count):
+    for idx in range(count):
+        yield {'id': idx, 'username': 'user%d' % idx,
+               'email': 'user%d@example.com' % idx}
+
+
+def export_list(count):
+    return reply_json(200, list(rows(count)))
+
+
+def export_stream(count):
+    return stream_json(200, rows(count))
+
+
+def run(factory, count):
+    tracemalloc.start()
+    started = time.perf_counter()
+    iterable = factory(count)(make_environ('/export'), start_response)
+    first = None
+    size = 0
+    for chunk in iterable:
+        if first is None:
+            first = time.perf_counter() - started
+        size += len(chunk)
+    total = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first, total, peak, size
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    title = 'Export of %d rows' % count
+    print(title)
+    print('-' * len(title))
+    for name, factory in (('list + reply_json', export_list),
+                          ('stream_json', export_stream)):
+        first, total, peak, size = run(factory, count)
+        print('  %-18s  first byte %8.1f ms  total %8.1f ms  '
+              'peak %8.1f MiB  (%d bytes)' % (
+                  name, first * 1000, total * 1000, peak / 2 ** 20, size))
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Cost of the `validate` decorator on an interface with many fields,
+with and without a compiled validation plan.
+
+    python benchmarks/bench_validation.py
+"""
+
+from urllib.parse import urlencode
+
+from zope.interface import Interface
+from zope.schema import ASCIILine, Bool, Int, List, TextLine
+
+from dolmen.api_engine.validation import validate
+from common import make_environ, measure, report
+
+
+def make_interface(count):
+    attrs = {}
+    params = {}
+    for idx in range(count):
+        kind = idx % 4
+        name = 'field%d' % idx
+        if kind == 0:
+            attrs[name] = TextLine(title=name, required=True)
+            params[name] = 'value %d' % idx
+        elif kind == 1:
+            attrs[name] = Int(title=name, required=True, min=0)
+            params[name] = str(idx)
+        elif kind == 2:
+            attrs[name] = List(
+                title=name, required=False, value_type=ASCIILine())
+            params[name] = ['a', 'b', 'c']
+        else:
+            attrs[name] = Bool(title=name, required=False)
+            params[name] = 'true'
+    iface = type(Interface)('IBench%d' % count, (Interface,), attrs)
+    return iface, urlencode(params, doseq=True)
+
+
+def action(environ, data):
+    return data
+
+
+def main():
+    for count in (4, 24, 48):
+        iface, query = make_interface(count)
+        default = validate(iface)(action)
+        compiled = validate(iface, compiled=True)(action)
+        assert default(make_environ(query=query), None) == (
+            compiled(make_environ(query=query), None))
+        report('%d fields' % count, [
+            ('default', measure(
+                lambda: default(make_environ(query=query), None))),
+            ('compiled', measure(
+                lambda: compiled(make_environ(query=query), None))),
+        ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers shared by the benchmark scripts.
+"""
+
+import io
+import sys
+import timeit
+
+
+def make_environ(path='/', method='GET', query='', body=b'',
+                 content_type='', **extra):
+    environ = {
+        'REQUEST_METHOD': method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'CONTENT_TYPE': content_type,
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    environ.update(extra)
+    return environ
+
+
+def start_response(status, headers, exc_info=None):
+    return None
+
+
+def consume(app, environ):
+    """Calls a WSGI application and exhausts its iterable.
+    """
+    iterable = app(environ, start_response)
+    try:
+        for chunk in iterable:
+            pass
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            close()
+
+
+def measure(func, min_time=0.2, repeat=3):
+    """Returns the best number of operations per second of `func`.
+    """
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    while elapsed < min_time:
+        number *= 2
+        elapsed = timer.timeit(number)
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return number / best
+
+
+def report(title, rows):
+    print(title)
+    print('-' * len(title))
+    width = max(len(name) for name, _ in rows)
+    for name, ops in rows:
+        print('  %s  %14.1f ops/s' % (name.ljust(width), ops))
+    print()
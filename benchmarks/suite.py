@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite of the request pipeline.
+
+WSGI environs are fed straight into the nodes, views and decorators of
+the engine, without any network. For each scenario, the suite reports
+the requests per second and the peak of the memory allocated while
+handling a single request, as traced by `tracemalloc`.
+
+The results can be saved as a baseline, then compared to it : the
+scenarios slower than the threshold are reported as regressions and
+the exit status is 1.
+
+    python benchmarks/suite.py
+    python benchmarks/suite.py --save baseline.json
+    python benchmarks/suite.py --compare baseline.json --threshold 10
+    python benchmarks/suite.py --only flood
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import tracemalloc
+from urllib.parse import urlencode
+
+from zope.interface import Interface
+from zope.schema import ASCIILine, Int, List, TextLine
+
+from dolmen.api_engine.auth import AuthCache, authenticate
+from dolmen.api_engine.components import APIView, BaseOverhead
+from dolmen.api_engine.context import RequestContext
+from dolmen.api_engine.multipart import multipart, persist_uploads
+from dolmen.api_engine.output import encode_multipart_formdata
+from dolmen.api_engine.responder import reply, reply_json
+from dolmen.api_engine.routing import RouterNode
+from dolmen.api_engine.upload import persist_files
+from dolmen.api_engine.validation import JSONSchema, validate
+from common import consume, make_environ, measure
+
+
+class IQuery(Interface):
+    term = ASCIILine(title="Search term", required=True)
+    page = Int(title="Page", required=False, min=1)
+
+
+class IForm(Interface):
+    title = TextLine(title="Title", required=True)
+    description = TextLine(title="Description", required=False)
+    ids = List(title="Identifiers", required=True, value_type=Int())
+
+
+ITEMS = JSONSchema.create_from_json({
+    'type': 'array',
+    'items': {
+        'type': 'object',
+        'required': ['id', 'name'],
+        'properties': {
+            'id': {'type': 'integer', 'minimum': 0},
+            'name': {'type': 'string'},
+            'tags': {'type': 'array', 'items': {'type': 'string'}},
+        },
+    },
+})
+
+
+class Overhead(BaseOverhead):
+
+    def __init__(self):
+        self.data = None
+
+    def set_data(self, data):
+        self.data = data
+
+
+class Users(APIView):
+
+    @validate(IQuery, compiled=True)
+    def GET(self, environ, data):
+        return reply_json(200, {'term': data.term, 'page': data.page})
+
+    @validate(IForm, compiled=True)
+    def POST(self, environ, data):
+        return reply(201, text='%d identifiers.' % len(data.ids))
+
+
+class Items(APIView):
+
+    @ITEMS.json_validator
+    def PUT(self, environ, overhead):
+        return reply(204)
+
+
+class Uploads(APIView):
+
+    def __init__(self, destination):
+        self.destination = destination
+
+    def POST(self, environ, overhead):
+        request = RequestContext.from_environ(environ).request
+        files = request.POST.getall('file')
+        persisted = list(persist_files(
+            self.destination, *files, single_pass=True))
+        return reply_json(201, [item[:3] for item in persisted])
+
+
+class StreamedUploads(APIView):
+
+    def __init__(self, destination):
+        self.parse = multipart(destination)(StreamedUploads.persist)
+
+    def POST(self, environ, overhead):
+        return self.parse(self, environ, overhead)
+
+    def persist(self, environ, overhead):
+        uploads = RequestContext.from_environ(environ).uploads
+        persisted = list(persist_uploads(uploads))
+        return reply_json(201, [item[:3] for item in persisted])
+
+
+class Node(RouterNode):
+
+    def overhead(self, environ, routing_args):
+        if isinstance(routing_args.endpoint, Items):
+            return Overhead()
+        return None
+
+
+def check_token(authvalue, environ, conf):
+    if authvalue == 'secret':
+        return (200, 'ada')
+    return (403, 'Invalid token.')
+
+
+def scenarios(destination):
+    """Returns the (name, function) of the scenarios, each function
+    handling one request.
+    """
+    node = Node({
+        '/users': Users(),
+        '/items': Items(),
+        '/uploads': Uploads(destination),
+        '/streamed': StreamedUploads(destination),
+    })
+    secured = authenticate(
+        {'Token': check_token}, cache=AuthCache())(node)
+
+    def request(app, *args, **kwargs):
+        return lambda: consume(app, make_environ(*args, **kwargs))
+
+    form = urlencode(
+        [('title', 'A large form'), ('description', 'x' * 1000)] +
+        [('ids', str(idx)) for idx in range(2000)]).encode('ascii')
+
+    items = json.dumps([
+        {'id': idx, 'name': 'item%d' % idx, 'tags': ['a', 'b']}
+        for idx in range(1000)]).encode('utf-8')
+
+    content_type, upload = encode_multipart_formdata([], [
+        ('file', 'file%d.bin' % idx, os.urandom(256 * 1024))
+        for idx in range(4)])
+
+    return [
+        ('small get', request(
+            node, '/users', query='term=dolmen&page=2')),
+        ('small get, authenticated', request(
+            secured, '/users', query='term=dolmen&page=2',
+            HTTP_AUTHORIZATION='Token secret')),
+        ('large form post', request(
+            node, '/users', 'POST', body=form,
+            content_type='application/x-www-form-urlencoded')),
+        ('large json body', request(
+            node, '/items', 'PUT', body=items,
+            content_type='application/json')),
+        ('multipart upload', request(
+            node, '/uploads', 'POST', body=upload,
+            content_type=content_type)),
+        ('multipart upload, streamed', request(
+            node, '/streamed', 'POST', body=upload,
+            content_type=content_type)),
+        ('reply', lambda: reply(200, text='Done.').body),
+        ('reply json', lambda: reply_json(200, {'status': 'done'}).body),
+        ('flood 400', request(node, '/users', query='page=0')),
+        ('flood 401', request(secured, '/users', query='term=dolmen')),
+        ('flood 403', request(
+            secured, '/users', query='term=dolmen',
+            HTTP_AUTHORIZATION='Token wrong')),
+        ('flood 404', request(node, '/unknown')),
+        ('flood 405', request(node, '/users', 'DELETE')),
+    ]
+
+
+def peak_memory(func):
+    """Returns the peak of the memory allocated by a call, in bytes.
+    """
+    func()  # Warm up the caches.
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        func()
+        return tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+
+def run(selected, min_time):
+    destination = tempfile.mkdtemp()
+    try:
+        results = {}
+        for name, func in scenarios(destination):
+            if selected and not any(part in name for part in selected):
+                continue
+            results[name] = {
+                'ops': measure(func, min_time=min_time),
+                'peak_kib': peak_memory(func) / 1024,
+            }
+        return results
+    finally:
+        shutil.rmtree(destination)
+
+
+def compare(results, baseline, threshold):
+    """Prints the results against the baseline and returns the names of
+    the regressed scenarios.
+    """
+    regressions = []
+    print('%-28s %12s %12s %8s %12s' % (
+        'scenario', 'baseline/s', 'current/s', 'change', 'peak KiB'))
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print('%-28s %12s %12.1f %8s %12.1f' % (
+                name, '-', result['ops'], '-', result['peak_kib']))
+            continue
+        change = (result['ops'] - previous['ops']) / previous['ops'] * 100
+        flag = ''
+        if change < -threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('%-28s %12.1f %12.1f %+7.1f%% %12.1f%s' % (
+            name, previous['ops'], result['ops'], change,
+            result['peak_kib'], flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--save', metavar='FILE',
+                        help='save the results as a baseline')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare the results to a baseline')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='slowdown, in percents, reported as a '
+                             'regression (default: 10)')
+    parser.add_argument('--only', action='append', default=[],
+                        help='run the scenarios containing this text')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='minimal duration of a measure, in seconds')
+    args = parser.parse_args(argv)
+
+    results = run(args.only, args.min_time)
+
+    if args.compare:
+        with open(args.compare) as fd:
+            baseline = json.load(fd)['scenarios']
+        regressions = compare(results, baseline, args.threshold)
+    else:
+        regressions = []
+        print('%-28s %12s %12s' % ('scenario', 'requests/s', 'peak KiB'))
+        for name, result in results.items():
+            print('%-28s %12.1f %12.1f' % (
+                name, result['ops'], result['peak_kib']))
+
+    if args.save:
+        with open(args.save, 'w') as fd:
+            json.dump({'python': platform.python_version(),
+                       'scenarios': results}, fd, indent=2, sort_keys=True)
+
+    if regressions:
+        print('\n%d regression(s): %s' % (
+            len(regressions), ', '.join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
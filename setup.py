@@ -44,5 +44,7 @@ setup(
     install_requires=install_requires,
     extras_require={
         'test': test_requires,
+        'json': ['orjson'],
+        'brotli': ['brotli'],
         },
     )
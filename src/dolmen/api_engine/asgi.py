@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+ASGI entry point.
+
+The routing, authentication and validation layers are synchronous and
+run in a pool of threads, never on the event loop. An endpoint, action
+or `APIView` method defined with `async def` returns a coroutine from
+that synchronous stack : the thread is released and the coroutine is
+awaited on the event loop, so slow I/O bound handlers do not hold a
+thread for their whole lifetime. Synchronous handlers run entirely in
+the pool.
+
+The request is authenticated before its body is received. Given a
+`max_body` size, larger bodies get a 413 Request Entity Too Large,
+without being read past the limit.
+"""
+
+import asyncio
+import sys
+import tempfile
+from functools import partial
+from inspect import isawaitable
+from io import BytesIO
+
+from .limits import BodyTooLarge
+from .responder import static_reply
+
+
+SPOOL_SIZE = 1024 * 1024
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+def build_environ(scope, body, length):
+    """Returns the WSGI environ of the ASGI HTTP scope.
+    """
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode(
+            'utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'CONTENT_LENGTH': str(length),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'asgi.scope': scope,
+    }
+    client = scope.get('client')
+    if client:
+        environ['REMOTE_ADDR'] = client[0]
+
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        if name != 'CONTENT_TYPE':
+            name = 'HTTP_' + name
+        if name in environ:
+            value = environ[name] + ',' + value
+        environ[name] = value
+    return environ
+
+
+def declared_length(scope):
+    """Returns the Content-Length of the request, or None.
+    """
+    for name, value in scope.get('headers', ()):
+        if name.lower() == b'content-length':
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+class ASGIAdapter(object):
+    """ASGI application serving an `APINode`, optionally protected by an
+    `authenticate` instance. Bodies larger than `max_body` bytes, if
+    given, are refused.
+    """
+
+    def __init__(self, node, auth=None, executor=None,
+                 spool_size=SPOOL_SIZE, max_body=None):
+        self.node = node
+        self.auth = auth
+        self.executor = executor
+        self.spool_size = spool_size
+        self.max_body = max_body
+
+    async def run_sync(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, partial(func, *args))
+
+    async def read_body(self, receive):
+        body = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+        more_body = True
+        length = 0
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                raise ClientDisconnected()
+            chunk = message.get('body', b'')
+            length += len(chunk)
+            if self.max_body is not None and length > self.max_body:
+                body.close()
+                raise BodyTooLarge(self.max_body)
+            body.write(chunk)
+            more_body = message.get('more_body', False)
+        body.seek(0)
+        return body, length
+
+    async def check(self, scope, environ):
+        """Authenticates the request and checks its declared length,
+        before its body is received. Returns the error response, or None.
+        """
+        if self.auth is not None:
+            error = await self.run_sync(self.auth.check, environ)
+            if isawaitable(error):
+                error = await error
+            if error is not None:
+                return error
+        if self.max_body is not None:
+            length = declared_length(scope)
+            if length is not None and length > self.max_body:
+                return static_reply(413)
+        return None
+
+    async def respond(self, environ):
+        response = await self.run_sync(self.node.routing, environ)
+        if isawaitable(response):
+            response = await response
+        if response is None:
+            response = self.node.not_found(environ)
+        return response
+
+    async def send_response(self, response, environ, send):
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+
+        iterable = response(environ, start_response)
+        try:
+            if isinstance(iterable, (list, tuple)):
+                chunks = iter(iterable)
+                next_chunk = partial(next, chunks, None)
+            else:
+                # Iterables may block, reading files for instance.
+                chunks = iter(iterable)
+                next_chunk = partial(self.run_sync, next, chunks, None)
+
+            chunk = next_chunk()
+            if isawaitable(chunk):
+                chunk = await chunk
+            status, headers = started
+            await send({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'),
+                             value.encode('latin-1'))
+                            for name, value in headers],
+            })
+            while chunk is not None:
+                if chunk:
+                    await send({'type': 'http.response.body',
+                                'body': chunk, 'more_body': True})
+                chunk = next_chunk()
+                if isawaitable(chunk):
+                    chunk = await chunk
+            await send({'type': 'http.response.body', 'body': b'',
+                        'more_body': False})
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise NotImplementedError(
+                'Unsupported ASGI scope type %r.' % scope['type'])
+        environ = build_environ(scope, BytesIO(), 0)
+        error = await self.check(scope, environ)
+        if error is not None:
+            # The body is not received.
+            return await self.send_response(error, environ, send)
+        try:
+            body, length = await self.read_body(receive)
+        except ClientDisconnected:
+            return
+        except BodyTooLarge:
+            return await self.send_response(
+                static_reply(413), environ, send)
+        environ['wsgi.input'] = body
+        environ['CONTENT_LENGTH'] = str(length)
+        try:
+            response = await self.respond(environ)
+            await self.send_response(response, environ, send)
+        finally:
+            body.close()
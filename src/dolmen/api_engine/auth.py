@@ -1,26 +1,225 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from inspect import iscoroutinefunction, isawaitable
+
+from .context import RequestContext
+from .metrics import HOOKS, notify
+from .responder import reply, static_reply
+
+
+class AuthCache(object):
+    """Bounded cache of the authentication results, keyed by
+    (authtype, authvalue).
+
+    Entries expire after `ttl` seconds, failures after `negative_ttl`
+    seconds, and the least recently used entries are evicted beyond
+    `maxsize` entries. A ttl of 0 disables the caching of the
+    corresponding results.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, negative_ttl=30,
+                 clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Returns the cached (code, payload) or None.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires, result = entry
+                if expires > self.clock():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, code, payload):
+        ttl = self.ttl if code == 200 else self.negative_ttl
+        if not ttl:
+            return
+        with self.lock:
+            self.entries[key] = (self.clock() + ttl, (code, payload))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, authtype, authvalue=None):
+        """Forgets the result for the given credentials, or all the
+        results of the given authentication type.
+        """
+        with self.lock:
+            if authvalue is not None:
+                self.entries.pop((authtype, authvalue), None)
+            else:
+                for key in [key for key in self.entries
+                            if key[0] == authtype]:
+                    del self.entries[key]
+
+    def invalidate_if(self, predicate):
+        """Forgets the results for which predicate(key, code, payload)
+        is true. For instance, all the credentials of a revoked user.
+        """
+        with self.lock:
+            for key in [key for key, (expires, result) in self.entries.items()
+                        if predicate(key, *result)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    @property
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self.entries)}
+
+
+class BackgroundLoop(object):
+    """An event loop running in a daemon thread, started on first use.
+    The asynchronous checkers of the WSGI requests all run on it : the
+    pools of connections and the shared checks live across requests.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever, daemon=True,
+                    name='dolmen.api_engine.auth')
+                thread.start()
+                self.loop = loop
+        return self.loop
+
+    def run(self, coroutine):
+        """Runs the coroutine on the loop and waits for its result.
+        """
+        loop = self.loop or self.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+
+BACKGROUND_LOOP = BackgroundLoop()
+
+
 class authenticate(object):
+    """WSGI middleware authenticating the requests, according to the
+    type of their Authorization header, by the corresponding checker :
 
-    def __init__(self, checkers, **conf):
+        checker(authvalue, environ, conf) -> (code, payload)
+
+    Checkers can be coroutine functions, given at most `timeout` seconds
+    to answer. Concurrent requests with the same credentials then share
+    a single check. Served through the `asgi` module, the check is
+    awaited on the event loop, otherwise it runs on a background loop
+    shared by the requests of all the threads.
+    """
+
+    def __init__(self, checkers, cache=None, timeout=None, **conf):
         self.checkers = checkers
+        self.cache = cache
+        self.timeout = timeout
         self.conf = conf
+        self.inflight = {}
+
+    def conclude(self, environ, result):
+        code, payload = result
+        if code == 200:
+            environ['auth_payload'] = payload
+            return None
+        return reply(code, text=payload)
+
+    async def verify(self, auth, checker, environ):
+        """Awaits the checker. Concurrent verifications of the same
+        credentials wait for the first one.
+        """
+        loop = asyncio.get_running_loop()
+        key = (loop, auth)
+        future = self.inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = self.inflight[key] = loop.create_future()
+        # The outcome may not be awaited by anyone else.
+        future.add_done_callback(
+            lambda future: future.cancelled() or future.exception())
+        try:
+            try:
+                result = await asyncio.wait_for(
+                    checker(auth[1], environ, self.conf), self.timeout)
+            except asyncio.TimeoutError:
+                result = (504, 'Authentication timed out.')
+            else:
+                if self.cache is not None:
+                    self.cache.set(auth, *result)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self.inflight[key]
+        return result
+
+    async def check_async(self, auth, checker, environ):
+        result = await self.verify(auth, checker, environ)
+        return self.conclude(environ, result)
+
+    def check(self, environ):
+        """Returns None if the request is authenticated, the payload of
+        the checker being stored in the environ as `auth_payload`.
+        Otherwise, returns the error response.
+        For an asynchronous checker, returns a coroutine.
+        """
+        auth = RequestContext.from_environ(environ).authorization
+        if auth is not None:
+            authtype, authvalue = auth
+            checker = self.checkers.get(authtype)
+            if checker is not None:
+                result = None
+                if self.cache is not None:
+                    result = self.cache.get(auth)
+                if result is None:
+                    if iscoroutinefunction(checker):
+                        return self.check_async(auth, checker, environ)
+                    result = checker(authvalue, environ, self.conf)
+                    if self.cache is not None:
+                        self.cache.set(auth, *result)
+                return self.conclude(environ, result)
+        return static_reply(401)
 
     def __call__(self, app):
         def method_watchdog(environ, start_response):
-            auth = environ.get('HTTP_AUTHORIZATION')
-            if auth is not None:
-                authtype, authvalue = auth.split(' ', 1)
-                checker = self.checkers.get(authtype)
-                if checker is not None:
-                    code, payload = self.checker(
-                        authvalue, environ, self.conf)
-
-                    if code == 200:
-                        environ['auth_payload'] = payload
-                        return app(environ, start_response)
-                    else:
-                        return reply(code, text=payload)(
-                            environ, start_response)
-            return reply(401)(environ, start_response)
+            started = time.perf_counter() if HOOKS else None
+            error = self.check(environ)
+            if isawaitable(error):
+                error = BACKGROUND_LOOP.run(error)
+            if started is not None:
+                notify('auth', environ, started)
+            if error is not None:
+                return error(environ, start_response)
+            return app(environ, start_response)
         return method_watchdog
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk requests.
+
+The `BulkDispatcher` is a WSGI application running a batch of
+sub-requests through the endpoints of an `APINode`, in one round-trip.
+The body of the request is a JSON array of sub-requests :
+
+    [{"path": "/users/details", "method": "GET",
+      "params": {"username": "ada"}}, ...]
+
+The params are given as the query string of the GET, HEAD and DELETE
+sub-requests, and as a JSON body otherwise, to be extracted by the
+validators as usual. The response streams, in order, the status and
+the body of each sub-request :
+
+    [{"status": 200, "body": {...}}, {"status": 404, "body": "..."}]
+
+The sub-requests share the environ of the request : wrapped by the
+`authenticate` middleware, the batch is authenticated once and the
+endpoints get its `auth_payload`.
+"""
+
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlencode
+
+from .context import RequestContext
+from .metrics import ENDPOINT_KEY
+from .responder import dumps_json, reply, reply_json, stream_json
+
+
+QUERY_METHODS = frozenset(('GET', 'HEAD', 'DELETE'))
+
+# Keys of the environ which are specific to a request.
+REQUEST_KEYS = (
+    RequestContext.key, ENDPOINT_KEY, 'wsgiorg.routing_args',
+    'webob._parsed_query_vars', 'webob._parsed_post_vars',
+    'webob._body_file', 'webob.is_body_seekable', 'webob.adhoc_attrs',
+    'HTTP_TRANSFER_ENCODING', 'HTTP_CONTENT_ENCODING',
+)
+
+
+def encode_result(status, headers, body):
+    """Returns the JSON item of a sub-request result. JSON bodies are
+    embedded as they are, without being decoded.
+    """
+    content_type = ''
+    for name, value in headers:
+        if name.lower() == 'content-type':
+            content_type = value.lower()
+    code = int(status[:3])
+    if content_type.startswith('application/json'):
+        return b'{"status":%d,"body":%s}' % (code, body.strip() or b'null')
+    text = body.decode('utf-8', 'replace') if body else None
+    return dumps_json({'status': code, 'body': text})
+
+
+def identity(data):
+    return data
+
+
+class BulkDispatcher(object):
+    """WSGI application dispatching a batch of at most `max_items`
+    sub-requests to the endpoints of the node. Given `workers`, the
+    sub-requests run in parallel on a pool of threads, their results
+    being streamed in order.
+    """
+
+    def __init__(self, node, max_items=100, workers=None):
+        self.node = node
+        self.max_items = max_items
+        self.workers = workers
+
+    def check_items(self, items):
+        """Returns the error of the batch, or None.
+        """
+        if not isinstance(items, list):
+            return 'The body must be an array of sub-requests.'
+        for idx, item in enumerate(items):
+            if not isinstance(item, dict):
+                return 'Sub-request %d is not an object.' % idx
+            path = item.get('path')
+            if not isinstance(path, str) or not path.startswith('/'):
+                return 'Sub-request %d has no absolute path.' % idx
+            if not isinstance(item.get('method', 'GET'), str):
+                return 'Sub-request %d has an invalid method.' % idx
+            if not isinstance(item.get('params', {}), dict):
+                return 'Sub-request %d has invalid params.' % idx
+        return None
+
+    def sub_environ(self, environ, item):
+        """Returns the environ of a sub-request, copied from the environ
+        of the batch.
+        """
+        sub = environ.copy()
+        for key in REQUEST_KEYS:
+            sub.pop(key, None)
+
+        method = item.get('method', 'GET').upper()
+        path, _, query = item['path'].partition('?')
+        params = item.get('params') or {}
+        body = b''
+        if method in QUERY_METHODS:
+            if params:
+                encoded = urlencode(params, doseq=True)
+                query = query and '%s&%s' % (query, encoded) or encoded
+            sub.pop('CONTENT_TYPE', None)
+        else:
+            body = dumps_json(params)
+            sub['CONTENT_TYPE'] = 'application/json'
+
+        sub['REQUEST_METHOD'] = method
+        # PEP 3333 : the native strings are latin-1 decoded.
+        sub['PATH_INFO'] = path.encode('utf-8').decode('latin-1')
+        sub['QUERY_STRING'] = query
+        sub['CONTENT_LENGTH'] = str(len(body))
+        sub['wsgi.input'] = BytesIO(body)
+        return sub
+
+    def run(self, environ, item):
+        """Runs a sub-request and returns its encoded result.
+        """
+        sub = self.sub_environ(environ, item)
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+            return lambda data: None
+
+        try:
+            response = self.node.routing(sub)
+            if response is None:
+                response = self.node.not_found(sub)
+            result = response(sub, start_response)
+            try:
+                body = b''.join(result)
+            finally:
+                close = getattr(result, 'close', None)
+                if close is not None:
+                    close()
+        except Exception:
+            errors = sub.get('wsgi.errors')
+            if errors is not None:
+                errors.write(traceback.format_exc())
+            return encode_result('500', (), b'Internal Server Error')
+        return encode_result(started[0], started[1], body)
+
+    def results(self, environ, items):
+        if not self.workers or self.workers < 2 or len(items) < 2:
+            for item in items:
+                yield self.run(environ, item)
+            return
+
+        pool = ThreadPoolExecutor(
+            max_workers=min(self.workers, len(items)))
+        try:
+            futures = [pool.submit(self.run, environ, item)
+                       for item in items]
+            for future in futures:
+                yield future.result()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def __call__(self, environ, start_response):
+        if environ['REQUEST_METHOD'] != 'POST':
+            response = reply(405, text='Batches must be POSTed.')
+            response.headers['Allow'] = 'POST'
+            return response(environ, start_response)
+
+        context = RequestContext.from_environ(environ)
+        if context.content_type != 'application/json':
+            response = reply(
+                406, text='Content type must be application/json')
+            return response(environ, start_response)
+        try:
+            items = context.json
+        except ValueError:
+            response = reply(400, text='The body is not valid JSON.')
+            return response(environ, start_response)
+
+        error = self.check_items(items)
+        if error is not None:
+            return reply_json(400, {'__general__': [error]})(
+                environ, start_response)
+        if len(items) > self.max_items:
+            response = reply(
+                413, text='At most %d sub-requests.' % self.max_items)
+            return response(environ, start_response)
+
+        response = stream_json(
+            200, self.results(environ, items), serializer=identity)
+        return response(environ, start_response)
@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+"""
+Server-side cache of the responses of the read endpoints.
+
+The `cached` decorator, placed under `validate`, memoizes the responses
+of an action by (action, validated data, path parameters) : equivalent
+query strings, normalized by the validation, share the same entry.
+Cached responses are served as static replies.
+
+Entries carry tags. The `invalidates` decorator, on the write
+endpoints, expires the entries with the given tags once the write
+succeeded. Tags are strings, or callables returning the tags for the
+arguments of the action.
+"""
+
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+
+from .components import BaseOverhead, then
+from .responder import StaticReply
+
+
+CACHEABLE_METHODS = frozenset(('GET', 'HEAD'))
+
+
+def freeze(value):
+    """Returns a hashable equivalent of the value, with a deterministic
+    representation.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted(
+            (key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted((freeze(item) for item in value), key=repr))
+    return value
+
+
+def data_key(environ, overhead):
+    """Keys the entries by the validated data and the path parameters.
+    """
+    if isinstance(overhead, BaseOverhead):
+        raise TypeError(
+            'The overhead %r is not the validated data: '
+            'the cache needs a key function.' % overhead)
+    routing_args = environ.get('wsgiorg.routing_args')
+    params = routing_args[1] if routing_args else None
+    return freeze((overhead, params))
+
+
+def resolve_tags(tags, args):
+    resolved = []
+    for tag in tags:
+        if callable(tag):
+            tag = tag(*args)
+            if isinstance(tag, str):
+                resolved.append(tag)
+            else:
+                resolved.extend(tag)
+        else:
+            resolved.append(tag)
+    return resolved
+
+
+class MemoryBackend(object):
+    """In-process cache, evicting the least recently used entries
+    beyond `maxsize` entries or `maxbytes` bytes of bodies.
+
+    The tags are versioned : invalidating a tag records the count of
+    invalidations as its generation, and the entries marked before are
+    dropped when accessed. Only the generations of the tags of cached
+    entries are kept. The others are forgotten, raising a `floor` : the
+    values marked before it, computed meanwhile, are not stored.
+    """
+
+    def __init__(self, maxsize=1024, maxbytes=None, ttl=60,
+                 clock=time.monotonic):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.references = {}
+        self.epoch = 0
+        self.floor = 0
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _release(self, marks):
+        for tag in marks[1]:
+            count = self.references[tag] - 1
+            if count:
+                self.references[tag] = count
+                continue
+            del self.references[tag]
+            generation = self.generations.pop(tag, None)
+            if generation is not None and generation > self.floor:
+                self.floor = generation
+
+    def _discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[3]
+            self._release(entry[1])
+
+    def _current(self, marks):
+        epoch, tags = marks
+        for tag in tags:
+            if self.generations.get(tag, 0) > epoch:
+                return False
+        return True
+
+    def _fresh(self, entry):
+        expires, marks, value, size = entry
+        if expires <= self.clock():
+            return False
+        return self._current(marks)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if self._fresh(entry):
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2]
+                self._discard(key)
+            self.misses += 1
+            return None
+
+    def mark(self, tags):
+        """Returns the tags, marked with the count of invalidations. They
+        are marked before computing the value : an invalidation occurring
+        meanwhile makes the stored value stale.
+        """
+        with self.lock:
+            return (self.epoch, tuple(tags))
+
+    def set(self, key, value, ttl=None, marks=None, size=0):
+        ttl = self.ttl if ttl is None else ttl
+        if not ttl or (self.maxbytes is not None and size > self.maxbytes):
+            return
+        with self.lock:
+            if marks is None:
+                marks = (self.epoch, ())
+            elif marks[0] < self.floor or not self._current(marks):
+                # Already stale.
+                return
+            self._discard(key)
+            self.entries[key] = (self.clock() + ttl, marks, value, size)
+            for tag in marks[1]:
+                self.references[tag] = self.references.get(tag, 0) + 1
+            self.size += size
+            while len(self.entries) > self.maxsize or (
+                    self.maxbytes is not None and self.size > self.maxbytes):
+                key, entry = self.entries.popitem(last=False)
+                self.size -= entry[3]
+                self._release(entry[1])
+
+    def invalidate(self, *tags):
+        with self.lock:
+            self.epoch += 1
+            for tag in tags:
+                if tag in self.references:
+                    self.generations[tag] = self.epoch
+                else:
+                    # No entry to expire, only the values being computed.
+                    self.floor = self.epoch
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.references.clear()
+            self.generations.clear()
+            self.floor = self.epoch
+            self.size = 0
+
+    @property
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self.entries), 'bytes': self.size}
+
+
+class FileBackend(object):
+    """Cache shared by the processes using the same directory, a tmpfs
+    such as /dev/shm being the fastest choice. Entries are pickled : the
+    directory must only be writable by the application.
+
+    The tags are versioned by token files, replaced on invalidation.
+    Expired and stale entries are removed when accessed, or by `prune`.
+    """
+
+    def __init__(self, directory, ttl=60, clock=time.time):
+        self.directory = directory
+        self.ttl = ttl
+        self.clock = clock
+        self.entries_dir = os.path.join(directory, 'entries')
+        self.tags_dir = os.path.join(directory, 'tags')
+        os.makedirs(self.entries_dir, exist_ok=True)
+        os.makedirs(self.tags_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def hashed(value):
+        return hashlib.sha1(repr(value).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        digested = self.hashed(key)
+        return os.path.join(self.entries_dir, digested[:2], digested[2:])
+
+    def _write(self, path, data):
+        tmppath = '%s.%s.part' % (path, uuid.uuid4().hex)
+        try:
+            with open(tmppath, 'xb') as fd:
+                fd.write(data)
+            os.replace(tmppath, path)
+        except BaseException:
+            if os.path.exists(tmppath):
+                os.unlink(tmppath)
+            raise
+
+    def _unlink(self, path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def _load(self, path):
+        try:
+            with open(path, 'rb') as fd:
+                return pickle.load(fd)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _token(self, tag):
+        try:
+            with open(os.path.join(self.tags_dir, self.hashed(tag)),
+                      'rb') as fd:
+                return fd.read()
+        except FileNotFoundError:
+            return None
+
+    def _fresh(self, entry):
+        expires, marks, value = entry
+        if expires <= self.clock():
+            return False
+        for tag, token in marks:
+            if self._token(tag) != token:
+                return False
+        return True
+
+    def get(self, key):
+        path = self.path(key)
+        entry = self._load(path)
+        if entry is not None:
+            if self._fresh(entry):
+                self.hits += 1
+                return entry[2]
+            self._unlink(path)
+        self.misses += 1
+        return None
+
+    def mark(self, tags):
+        return tuple((tag, self._token(tag)) for tag in tags)
+
+    def set(self, key, value, ttl=None, marks=(), size=0):
+        ttl = self.ttl if ttl is None else ttl
+        if not ttl:
+            return
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._write(path, pickle.dumps(
+            (self.clock() + ttl, marks, value),
+            protocol=pickle.HIGHEST_PROTOCOL))
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self._write(os.path.join(self.tags_dir, self.hashed(tag)),
+                        uuid.uuid4().bytes)
+
+    def prune(self, maxbytes=None):
+        """Removes the expired and stale entries, then the least recently
+        written ones beyond `maxbytes` bytes. Returns the remaining size.
+        """
+        remaining = []
+        for root, dirs, files in os.walk(self.entries_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                entry = self._load(path)
+                if entry is None or not self._fresh(entry):
+                    self._unlink(path)
+                    continue
+                try:
+                    stats = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                remaining.append((stats.st_mtime, stats.st_size, path))
+        size = sum(item[1] for item in remaining)
+        if maxbytes is not None:
+            remaining.sort()
+            for mtime, fsize, path in remaining:
+                if size <= maxbytes:
+                    break
+                self._unlink(path)
+                size -= fsize
+        return size
+
+    def clear(self):
+        shutil.rmtree(self.entries_dir, ignore_errors=True)
+        os.makedirs(self.entries_dir, exist_ok=True)
+
+    @property
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class cached(object):
+    """Decorator caching the responses of an action, or of an `APIView`
+    method, for `ttl` seconds (the default of the backend if None).
+
+    Only the complete 200 responses to GET and HEAD requests are cached.
+    The key is computed by `key(environ, overhead)`, `data_key` by
+    default.
+    """
+
+    def __init__(self, backend, ttl=None, tags=(), key=data_key):
+        self.backend = backend
+        self.ttl = ttl
+        self.tags = tags
+        self.key = key
+
+    def store(self, key, response, marks):
+        if response.status_int != 200:
+            return response
+        if isinstance(response, StaticReply):
+            value = response
+        elif isinstance(response.app_iter, (list, tuple)):
+            value = StaticReply.snapshot(response)
+        else:
+            # Streamed bodies are not read.
+            return response
+        self.backend.set(
+            key, value, ttl=self.ttl, marks=marks, size=len(value.body))
+        return value
+
+    def __call__(self, action):
+        name = '%s.%s' % (action.__module__, action.__qualname__)
+
+        @wraps(action)
+        def cached_action(*args):
+            environ, overhead = args[-2:]
+            if environ['REQUEST_METHOD'] not in CACHEABLE_METHODS:
+                return action(*args)
+
+            key = (name, self.key(environ, overhead))
+            response = self.backend.get(key)
+            if response is not None:
+                return response
+
+            marks = self.backend.mark(resolve_tags(self.tags, args))
+            return then(action(*args), lambda response: self.store(
+                key, response, marks))
+        return cached_action
+
+
+class invalidates(object):
+    """Decorator invalidating the tags of the backend once the action
+    succeeded, with a status below 400.
+    """
+
+    def __init__(self, backend, *tags):
+        self.backend = backend
+        self.tags = tags
+
+    def conclude(self, response, args):
+        if response.status_int < 400:
+            self.backend.invalidate(*resolve_tags(self.tags, args))
+        return response
+
+    def __call__(self, action):
+
+        @wraps(action)
+        def invalidating_action(*args):
+            return then(action(*args), lambda response: self.conclude(
+                response, args))
+        return invalidating_action
@@ -1,8 +1,13 @@
 # -*- coding: utf-8 -*-
 
 from abc import ABC, abstractmethod
+from functools import partial
+from inspect import isawaitable
+from time import perf_counter
 from zope.interface import Interface, implementer
-from .responder import reply
+from .definitions import METHODS
+from .metrics import HOOKS, notify
+from .responder import StaticReply, register_static_reply
 
 
 class BaseOverhead(ABC):
@@ -16,23 +21,111 @@ class BaseOverhead(ABC):
 class View(ABC):
     pass
 
+
+def handler_environ(args):
+    """Returns the environ among the arguments of an action, or of an
+    `APIView` method.
+    """
+    if isinstance(args[0], View):
+        return args[1]
+    return args[0]
+
+
+async def chain(awaitable, callback, errback):
+    try:
+        response = await awaitable
+    except BaseException as error:
+        if errback is None:
+            raise
+        return errback(error)
+    return callback(response)
+
+
+def then(response, callback, errback=None):
+    """Returns `callback(response)`. Asynchronous handlers, see the
+    `asgi` module, return an awaitable : the callback is then applied
+    once it is awaited, and `errback`, if given, to the exception raised
+    instead.
+    """
+    if isawaitable(response):
+        return chain(response, callback, errback)
+    return callback(response)
+
         
+def default_options(view, environ, overhead):
+    return view._options
+
+
+def class_attribute(cls, name):
+    """Returns the attribute of the class as defined, without invoking
+    its descriptor, or None.
+    """
+    for klass in cls.__mro__:
+        if name in klass.__dict__:
+            return klass.__dict__[name]
+    return None
+
+
+def binder(attribute):
+    """Returns a callable binding the attribute to an instance, as
+    `getattr` does : methods are bound, static methods unwrapped and
+    other callables returned as they are.
+    """
+    get = getattr(type(attribute), '__get__', None)
+    if get is None:
+        return lambda view, cls: attribute
+    return partial(get, attribute)
+
+
 class APIView(View):
     """Implementation of an action as a class.
     This works as an HTTP METHOD dispatcher.
     The method names of the class must be a valid uppercase HTTP METHOD name
     example : OPTIONS, GET, POST
+
+    The dispatch table is computed once, when the class is created.
+    HEAD falls back on GET and OPTIONS answers with the allowed methods,
+    unless the class defines them explicitly.
     """
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.compile_dispatch()
+
+    @classmethod
+    def compile_dispatch(cls):
+        dispatch = {}
+        for method in METHODS:
+            worker = class_attribute(cls, method)
+            if worker is not None:
+                dispatch[method] = binder(worker)
+        if 'GET' in dispatch:
+            dispatch.setdefault('HEAD', dispatch['GET'])
+        dispatch.setdefault('OPTIONS', binder(default_options))
+
+        cls.allowed_methods = frozenset(dispatch)
+        allow = ', '.join(sorted(dispatch))
+        cls._dispatch = dispatch
+        cls._options = StaticReply(204, headers=[('Allow', allow)])
+        cls._not_allowed = StaticReply(405, headers=[('Allow', allow)])
+
     def __call__(self, environ, overhead):
-        method = environ['REQUEST_METHOD'].upper()
-        worker = getattr(self, method, None)
-        if worker is None:
-            # Method not allowed
-            response = reply(405)
-        else:
-            response = worker(environ, overhead)
-        return response
+        method = environ['REQUEST_METHOD']
+        bind = self._dispatch.get(method)
+        if bind is None:
+            bind = self._dispatch.get(method.upper())
+            if bind is None:
+                # Method not allowed. The response is shared : it
+                # must not be modified.
+                return self._not_allowed
+        return bind(self, self.__class__)(environ, overhead)
+
+
+APIView.compile_dispatch()
+
+
+NOT_FOUND = register_static_reply(
+    404, "Not found. Please consult the API documentation.")
 
 
 class APINode(ABC):
@@ -50,20 +143,59 @@ class APINode(ABC):
         to the HTTP Error (404, 405, 406).
         """
 
-    def routing(self, environ):
+    def allowed_methods(self, routing_args):
+        """Returns the methods allowed by the looked up endpoint, or None
+        if they are unknown.
+        """
+        return None
+
+    def path_info(self, environ):
         # according to PEP 3333 the native string representing PATH_INFO
         # (and others) can only contain unicode codepoints from 0 to 255,
         # which is why we need to decode to latin-1 instead of utf-8 here.
         # We transform it back to UTF-8
-        path_info = environ['PATH_INFO'].encode('latin-1').decode('utf-8')
-        routing_args = self.lookup(path_info, environ)
+        return environ['PATH_INFO'].encode('latin-1').decode('utf-8')
+
+    def routing(self, environ):
+        started = perf_counter() if HOOKS else None
+        routing_args = self.lookup(self.path_info(environ), environ)
+        if started is not None:
+            notify('routing', environ, started)
+            started = perf_counter()
         if routing_args:
-            return self.process_endpoint(environ, routing_args)
+            response = self.process_endpoint(environ, routing_args)
+            if started is not None:
+                notify('endpoint', environ, started)
+            return response
         return None
 
+    def not_found(self, environ):
+        return NOT_FOUND
+
+    def instrumented(self, environ, start_response):
+        """Handles the request, notifying the hooks of the duration of
+        the response call and of the whole request, with its status.
+        """
+        started = perf_counter()
+        statuses = []
+
+        def recording_start_response(status, headers, exc_info=None):
+            statuses.append(status[:3])
+            return start_response(status, headers, exc_info)
+
+        response = self.routing(environ)
+        if response is None:
+            response = self.not_found(environ)
+        responding = perf_counter()
+        result = response(environ, recording_start_response)
+        notify('response', environ, responding)
+        notify('request', environ, started, statuses and statuses[-1] or None)
+        return result
+
     def __call__(self, environ, start_response):
+        if HOOKS:
+            return self.instrumented(environ, start_response)
         response = self.routing(environ)
         if response is None:
-            response = reply(
-                404, "Not found. Please consult the API documentation.")
+            response = self.not_found(environ)
         return response(environ, start_response)
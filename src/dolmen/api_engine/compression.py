@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Compression of the responses, negotiated on the Accept-Encoding header.
+
+The `compress` middleware encodes the bodies with gzip, deflate or,
+if the `brotli` package is installed, brotli. The bodies are compressed
+chunk by chunk while the server iterates them : streamed responses stay
+streamed. Small bodies, binary content types, partial content and
+bodies already encoded are sent as they are.
+"""
+
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_TYPES = frozenset((
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+))
+
+UNCOMPRESSED_STATUSES = frozenset(('204', '206', '304'))
+
+
+class ZlibEncoder(object):
+
+    def __init__(self, level, wbits):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder(object):
+
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+ENCODERS = {
+    'gzip': lambda level: ZlibEncoder(level, 16 + zlib.MAX_WBITS),
+    'deflate': lambda level: ZlibEncoder(level, zlib.MAX_WBITS),
+}
+
+if brotli is not None:
+    ENCODERS['br'] = lambda level: BrotliEncoder(min(level, 11))
+
+
+def negotiate(header, encodings):
+    """Returns the encoding preferred by the client among the given
+    ones, by quality then in the given order, or None.
+    """
+    if not header:
+        return None
+    qualities = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        qualities[coding] = quality
+
+    best, best_quality = None, 0
+    default = qualities.get('*', 0)
+    for encoding in encodings:
+        quality = qualities.get(encoding, default)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compressible(content_type, types=COMPRESSIBLE_TYPES):
+    if not content_type:
+        return False
+    mimetype = content_type.partition(';')[0].strip().lower()
+    return (mimetype.startswith('text/') or mimetype in types or
+            mimetype.endswith('+json') or mimetype.endswith('+xml'))
+
+
+def add_vary(headers, value='Accept-Encoding'):
+    for idx, (name, current) in enumerate(headers):
+        if name.lower() == 'vary':
+            if value.lower() not in current.lower():
+                headers[idx] = (name, '%s, %s' % (current, value))
+            return
+    headers.append(('Vary', value))
+
+
+class compress(object):
+    """WSGI middleware compressing the responses of at least `min_size`
+    bytes (or of unknown size) with a compressible content type.
+
+    Compressed responses lose their Content-Length and their strong
+    ETags are made weak, the bytes being different.
+    """
+
+    def __init__(self, min_size=1024, level=6, types=COMPRESSIBLE_TYPES,
+                 encodings=('br', 'gzip', 'deflate')):
+        self.min_size = min_size
+        self.level = level
+        self.types = types
+        self.encodings = tuple(
+            encoding for encoding in encodings if encoding in ENCODERS)
+
+    def eligible(self, status, headers):
+        if status[:3] in UNCOMPRESSED_STATUSES:
+            return False
+        content_type = None
+        for name, value in headers:
+            name = name.lower()
+            if name == 'content-encoding':
+                return False
+            elif name == 'content-type':
+                content_type = value
+            elif name == 'content-length':
+                if int(value) < self.min_size:
+                    return False
+            elif name == 'cache-control' and 'no-transform' in value:
+                return False
+        return compressible(content_type, self.types)
+
+    def encode_headers(self, headers, encoding):
+        encoded = [('Content-Encoding', encoding)]
+        for name, value in headers:
+            lname = name.lower()
+            if lname == 'content-length':
+                continue
+            if lname == 'etag' and value.startswith('"'):
+                value = 'W/' + value
+            encoded.append((name, value))
+        add_vary(encoded)
+        return encoded
+
+    def __call__(self, app):
+
+        def compressed(environ, start_response):
+            encoding = None
+            if environ['REQUEST_METHOD'] != 'HEAD':
+                encoding = negotiate(
+                    environ.get('HTTP_ACCEPT_ENCODING'), self.encodings)
+            state = {}
+
+            def compressing_start_response(status, headers, exc_info=None):
+                headers = list(headers)
+                encoder = None
+                if self.eligible(status, headers):
+                    if encoding is not None:
+                        encoder = ENCODERS[encoding](self.level)
+                        headers = self.encode_headers(headers, encoding)
+                    else:
+                        add_vary(headers)
+                state['encoder'] = encoder
+                write = start_response(status, headers, exc_info)
+                if encoder is None:
+                    return write
+
+                def compressing_write(data):
+                    write(encoder.compress(data) + encoder.flush())
+                return compressing_write
+
+            iterable = app(environ, compressing_start_response)
+            if 'encoder' in state and state['encoder'] is None:
+                # Not compressed : the iterable, maybe a file wrapper, is
+                # given to the server as it is.
+                return iterable
+            return encode_iterable(iterable, state)
+        return compressed
+
+
+def encode_iterable(iterable, state):
+    try:
+        for chunk in iterable:
+            # The application may start the response on first iteration.
+            encoder = state.get('encoder')
+            if encoder is None:
+                yield chunk
+                continue
+            data = encoder.compress(chunk)
+            if data:
+                yield data
+        encoder = state.get('encoder')
+        if encoder is not None:
+            yield encoder.finish()
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            close()
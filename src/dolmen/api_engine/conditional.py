@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP conditional requests.
+
+The `conditional` decorator tags the responses of an action, or of an
+`APIView` method, with an ETag and a Last-Modified date, and answers
+the conditional requests :
+
+  - `If-None-Match` and `If-Modified-Since` on GET and HEAD requests
+    get a 304 Not Modified,
+  - `If-Match` and `If-Unmodified-Since` on the other methods get a 412
+    Precondition Failed.
+
+Given a `version` or `last_modified` callback, cheaper than the action,
+the conditions are checked before the action is called. Otherwise, the
+ETag is a hash of the body of the response, which only saves the
+bandwidth, and the preconditions of the other methods are not checked.
+"""
+
+import hashlib
+from functools import wraps
+
+from webob.etag import AnyETag
+from webob.datetime_utils import parse_date, serialize_date
+
+from .components import handler_environ, then
+from .context import RequestContext
+from .responder import HTTPRESPONSES, StaticReply, static_reply
+
+
+SAFE_METHODS = frozenset(('GET', 'HEAD'))
+
+
+def body_etag(body):
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def format_etag(tag, weak=False):
+    if weak:
+        return 'W/"%s"' % tag
+    return '"%s"' % tag
+
+
+def http_date(value):
+    """Returns the date, as a timestamp or a datetime, truncated to the
+    second, as sent in the headers.
+    """
+    return parse_date(serialize_date(value))
+
+
+def not_modified(request, tag, modified):
+    """Tells if the client's copy is up to date. If-None-Match takes
+    precedence over If-Modified-Since.
+    """
+    if request.if_none_match:
+        return tag is not None and tag in request.if_none_match
+    if modified is not None and request.if_modified_since is not None:
+        return modified <= request.if_modified_since
+    return False
+
+
+def precondition_failed(request, tag, modified, weak=False):
+    """Tells if the client's copy is outdated. If-Match takes precedence
+    over If-Unmodified-Since.
+    """
+    if request.environ.get('HTTP_IF_MATCH'):
+        if request.if_match is AnyETag:
+            return False
+        if tag is None:
+            return True
+        # Strong comparison : weak tags never match.
+        return weak or tag not in request.if_match
+    if modified is not None and request.if_unmodified_since is not None:
+        return modified > request.if_unmodified_since
+    return False
+
+
+def not_modified_reply(tag, modified, weak=False):
+    response = HTTPRESPONSES[304]()
+    if tag is not None:
+        response.headers['ETag'] = format_etag(tag, weak)
+    if modified is not None:
+        response.last_modified = modified
+    return response
+
+
+class conditional(object):
+    """Decorator handling the conditional requests of an action.
+
+    `version` and `last_modified` are called with the arguments of the
+    action and return the tag (a string) and the date (a timestamp or a
+    datetime) of the current state of the resource, or None if unknown.
+    """
+
+    def __init__(self, version=None, last_modified=None, weak=False):
+        self.version = version
+        self.last_modified = last_modified
+        self.weak = weak
+
+    def validators(self, args):
+        tag = modified = None
+        if self.version is not None:
+            tag = self.version(*args)
+        if self.last_modified is not None:
+            modified = self.last_modified(*args)
+            if modified is not None:
+                modified = http_date(modified)
+        return tag, modified
+
+    def tag_response(self, request, response, tag, modified):
+        if response.status_int != 200:
+            return response
+
+        weak = self.weak
+        if tag is None and self.version is None:
+            if isinstance(response, StaticReply):
+                body = response.body
+            elif isinstance(response.app_iter, (list, tuple)):
+                body = response.body
+            else:
+                # Streamed bodies are not read.
+                return response
+            tag, weak = body_etag(body), False
+            if (request.method in SAFE_METHODS and
+                    request.if_none_match and tag in request.if_none_match):
+                return not_modified_reply(tag, modified, weak)
+
+        headers = []
+        if tag is not None:
+            headers.append(('ETag', format_etag(tag, weak)))
+        if modified is not None:
+            headers.append(('Last-Modified', serialize_date(modified)))
+        if not headers:
+            return response
+        if isinstance(response, StaticReply):
+            # Static replies are shared : they are copied.
+            return response.with_headers(headers)
+        for name, value in headers:
+            response.headers[name] = value
+        return response
+
+    def __call__(self, action):
+
+        @wraps(action)
+        def conditional_action(*args):
+            request = RequestContext.from_environ(
+                handler_environ(args)).request
+            tag, modified = self.validators(args)
+
+            if request.method in SAFE_METHODS:
+                if not_modified(request, tag, modified):
+                    return not_modified_reply(tag, modified, self.weak)
+            elif self.version is not None or self.last_modified is not None:
+                if precondition_failed(request, tag, modified, self.weak):
+                    return static_reply(412)
+
+            return then(action(*args), lambda response: self.tag_response(
+                request, response, tag, modified))
+        return conditional_action
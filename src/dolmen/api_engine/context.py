@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+from webob import Request
+
+
+class reify(object):
+    """Computes the value once per instance, then stores it as a plain
+    attribute, shadowing the descriptor.
+    """
+
+    def __init__(self, wrapped):
+        self.wrapped = wrapped
+        self.__name__ = wrapped.__name__
+        self.__doc__ = wrapped.__doc__
+
+    def __get__(self, inst, cls=None):
+        if inst is None:
+            return self
+        value = self.wrapped(inst)
+        inst.__dict__[self.__name__] = value
+        return value
+
+
+class RequestContext(object):
+    """The request, parsed lazily and only once.
+
+    The context is stored in the environ and shared by all the layers
+    handling the request (authentication, validation, views), each part
+    of the request being parsed on first access only.
+    """
+    key = 'dolmen.api_engine.context'
+
+    def __init__(self, environ):
+        self.environ = environ
+
+    @classmethod
+    def from_environ(cls, environ):
+        context = environ.get(cls.key)
+        if context is None or context.environ is not environ:
+            # A copied environ must not share the context of the original.
+            context = environ[cls.key] = cls(environ)
+        return context
+
+    @reify
+    def request(self):
+        return Request(self.environ)
+
+    @reify
+    def content_type(self):
+        return self.request.content_type
+
+    @reify
+    def query(self):
+        return self.request.GET.dict_of_lists()
+
+    @reify
+    def form(self):
+        return self.request.POST.dict_of_lists()
+
+    @reify
+    def json(self):
+        return self.request.json
+
+    @reify
+    def authorization(self):
+        """Returns the (authtype, authvalue) of the Authorization header
+        or None if it is missing or malformed.
+        """
+        auth = self.environ.get('HTTP_AUTHORIZATION')
+        if auth:
+            authtype, sep, authvalue = auth.partition(' ')
+            if sep:
+                return authtype, authvalue
+        return None
@@ -1,16 +1,170 @@
 # -*- coding: utf-8 -*-
 
+import re
 from functools import wraps
 
+from .components import then
+from .definitions import METHODS
+from .responder import StaticReply, static_reply
+
 
 def allow_origins(origins, codes=None):
+    def add_header(res):
+        if codes and not res.status_int in codes:
+            return res
+        if isinstance(res, StaticReply):
+            # Static replies are shared : they are copied.
+            return res.with_headers(
+                [("Access-Control-Allow-Origin", origins)])
+        res.headers["Access-Control-Allow-Origin"] = origins
+        return res
+
     def cors_wrapper(method):
         @wraps(method)
         def add_cors_header(*args, **kwargs):
-            res = method(*args, **kwargs)
-            if codes and not res.status_int in codes:
-                return res
-            res.headers["Access-Control-Allow-Origin"] = origins
-            return res
+            return then(method(*args, **kwargs), add_header)
         return add_cors_header
     return cors_wrapper
+
+
+class CORSPolicy(object):
+    """The origins allowed to access the API, given as a set of exact
+    origins ('*' allowing any) and as regular expressions, compiled into
+    a single pattern.
+
+    `headers` are the request headers allowed in preflight requests,
+    '*' allowing any. `max_age` is the number of seconds the browsers
+    may cache the answers to the preflight requests.
+    """
+
+    def __init__(self, origins=(), patterns=(), methods=None, headers=(),
+                 expose_headers=(), credentials=False, max_age=None):
+        self.origins = frozenset(origins)
+        self.any_origin = '*' in self.origins
+        if patterns:
+            self.pattern = re.compile('|'.join(
+                '(?:%s)' % pattern for pattern in patterns))
+        else:
+            self.pattern = None
+        self.methods = methods and frozenset(methods) or METHODS
+        self.headers = headers if headers == '*' else frozenset(
+            header.lower() for header in headers)
+        self.expose_headers = tuple(expose_headers)
+        self.credentials = credentials
+        self.max_age = max_age
+
+    def allows(self, origin):
+        if self.any_origin or origin in self.origins:
+            return True
+        return (self.pattern is not None and
+                self.pattern.fullmatch(origin) is not None)
+
+    def allows_headers(self, requested):
+        if self.headers == '*' or not requested:
+            return True
+        return all(header.strip().lower() in self.headers
+                   for header in requested.split(','))
+
+    def origin_headers(self, origin):
+        if self.any_origin and not self.credentials:
+            return [('Access-Control-Allow-Origin', '*')]
+        headers = [('Access-Control-Allow-Origin', origin),
+                   ('Vary', 'Origin')]
+        if self.credentials:
+            headers.append(('Access-Control-Allow-Credentials', 'true'))
+        return headers
+
+    def response_headers(self, origin):
+        headers = self.origin_headers(origin)
+        if self.expose_headers:
+            headers.append(('Access-Control-Expose-Headers',
+                            ', '.join(self.expose_headers)))
+        return headers
+
+    def preflight_headers(self, methods):
+        """The headers of the answers to the preflights, for a set of
+        allowed methods, apart from the origin.
+        """
+        headers = [('Access-Control-Allow-Methods', ', '.join(sorted(
+            self.methods & methods)))]
+        if self.headers != '*' and self.headers:
+            headers.append(('Access-Control-Allow-Headers',
+                            ', '.join(sorted(self.headers))))
+        if self.max_age is not None:
+            headers.append(('Access-Control-Max-Age', str(self.max_age)))
+        return tuple(headers)
+
+
+PREFLIGHT_VARY = (
+    'Vary', 'Origin, Access-Control-Request-Method, '
+    'Access-Control-Request-Headers')
+
+
+class cors(object):
+    """WSGI middleware applying the CORS policy to the endpoints of an
+    `APINode`.
+
+    Preflight requests are answered directly, from the methods allowed
+    by the looked up endpoint : the wrapped application, which may
+    include the authentication, is not called. The preflight headers are
+    computed once per set of allowed methods.
+
+        application = cors(policy, node)(authenticate(checkers)(node))
+    """
+
+    def __init__(self, policy, node):
+        self.policy = policy
+        self.node = node
+        self.preflights = {}
+
+    def preflight(self, environ, start_response, origin, method):
+        routing_args = self.node.lookup(
+            self.node.path_info(environ), environ)
+        if not routing_args:
+            return self.node.not_found(environ)(environ, start_response)
+
+        methods = frozenset(
+            self.node.allowed_methods(routing_args) or METHODS)
+        requested = environ.get('HTTP_ACCESS_CONTROL_REQUEST_HEADERS')
+        if (method not in methods or method not in self.policy.methods or
+                not self.policy.allows_headers(requested)):
+            return static_reply(403)(environ, start_response)
+
+        headers = self.preflights.get(methods)
+        if headers is None:
+            headers = self.preflights[methods] = (
+                self.policy.preflight_headers(methods))
+        headers = list(headers)
+        headers.extend(self.policy.origin_headers(origin))
+        if requested and self.policy.headers == '*':
+            headers.append(('Access-Control-Allow-Headers', requested))
+        headers = [header for header in headers if header[0] != 'Vary']
+        headers.append(PREFLIGHT_VARY)
+        start_response('204 No Content', headers)
+        return ()
+
+    def __call__(self, app):
+        def cors_application(environ, start_response):
+            origin = environ.get('HTTP_ORIGIN')
+            if origin is None:
+                return app(environ, start_response)
+
+            method = environ.get('HTTP_ACCESS_CONTROL_REQUEST_METHOD')
+            if environ['REQUEST_METHOD'] == 'OPTIONS' and method:
+                if not self.policy.allows(origin):
+                    return static_reply(403)(environ, start_response)
+                return self.preflight(
+                    environ, start_response, origin, method)
+
+            if not self.policy.allows(origin):
+                # The browser denies the access to the response.
+                return app(environ, start_response)
+
+            headers = self.policy.response_headers(origin)
+
+            def cors_start_response(status, response_headers,
+                                    exc_info=None):
+                return start_response(
+                    status, list(response_headers) + headers, exc_info)
+            return app(environ, cors_start_response)
+        return cors_application
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Limits of the requests.
+
+The `limits` decorator bounds the resources an endpoint spends on a
+request, before the extractors parse it :
+
+  - the number and total size of the headers get a 431 Request Header
+    Fields Too Large,
+  - the size of the body, the number of fields of the query string and
+    of the form, and the nesting depth of the JSON documents get a 413
+    Request Entity Too Large.
+
+The form and JSON bodies, parsed at once by the extractors, are read
+beforehand in chunks, at most `max_body` bytes. The other bodies, such
+as uploads, are read by the action through a `LimitedInput`, raising
+`BodyTooLarge` once the limit is crossed.
+"""
+
+import re
+from functools import wraps
+from io import BytesIO
+
+from .components import handler_environ, then
+from .responder import STREAM_CHUNKSIZE, static_reply
+
+
+# The bodies parsed at once, in memory.
+BUFFERED_TYPES = frozenset((
+    'application/x-www-form-urlencoded',
+    'application/json',
+))
+
+JSON_STRING = re.compile(rb'"(?:[^"\\]|\\.)*"', re.DOTALL)
+NOT_BRACKETS = bytes(
+    byte for byte in range(256) if byte not in b'[]{}')
+
+
+class BodyTooLarge(Exception):
+    """The body of the request is larger than the limit.
+    """
+
+
+class LimitedInput(object):
+    """File-like wrapper of `wsgi.input` raising `BodyTooLarge` when
+    more than `limit` bytes are read. Unsized reads are bounded as
+    well, instead of reading the stream to its end.
+
+    Given the `length` of the body, its Content-Length, the reads never
+    go past it, as required by PEP 3333 : the server may block, waiting
+    for bytes the client will not send.
+    """
+
+    def __init__(self, stream, limit, length=None):
+        self.stream = stream
+        self.limit = limit
+        self.length = length
+        self.position = 0
+
+    def bound(self, size):
+        # One more byte than allowed, to detect the overflow.
+        remaining = self.limit - self.position + 1
+        if self.length is not None:
+            remaining = min(remaining, self.length - self.position)
+        if size is None or size < 0 or size > remaining:
+            return remaining
+        return size
+
+    def count(self, data):
+        self.position += len(data)
+        if self.position > self.limit:
+            raise BodyTooLarge(self.limit)
+        return data
+
+    def read(self, size=-1):
+        return self.count(self.stream.read(self.bound(size)))
+
+    def readline(self, size=-1):
+        return self.count(self.stream.readline(self.bound(size)))
+
+    def readlines(self, hint=-1):
+        return list(iter(self.readline, b''))
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def close(self):
+        close = getattr(self.stream, 'close', None)
+        if close is not None:
+            close()
+
+
+def read_body(stream, limit, chunk_size=STREAM_CHUNKSIZE, length=None):
+    """Reads the body, in chunks, raising `BodyTooLarge` as soon as
+    more than `limit` bytes are read. Given its `length`, the body is
+    read up to it, otherwise to the end of the stream, as a chunked
+    body.
+    """
+    stream = LimitedInput(stream, limit, length)
+    chunks = []
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return b''.join(chunks)
+        chunks.append(chunk)
+
+
+def count_fields(encoded):
+    """Returns the number of fields of an urlencoded string, an upper
+    bound as the empty fields are counted.
+    """
+    if not encoded:
+        return 0
+    return encoded.count(b'&' if isinstance(encoded, bytes) else '&') + 1
+
+
+def json_depth(body, limit=None):
+    """Returns the nesting depth of a JSON document, without decoding
+    it, or `limit + 1` once the limit is exceeded.
+    """
+    brackets = JSON_STRING.sub(b'', body).translate(None, NOT_BRACKETS)
+    depth = deepest = 0
+    for byte in brackets:
+        if byte in b'[{':
+            depth += 1
+            if depth > deepest:
+                deepest = depth
+                if limit is not None and deepest > limit:
+                    return deepest
+        else:
+            depth -= 1
+    return deepest
+
+
+def has_body(environ):
+    if environ.get('HTTP_TRANSFER_ENCODING', '').lower() == 'chunked':
+        return True
+    try:
+        return int(environ.get('CONTENT_LENGTH') or 0) > 0
+    except ValueError:
+        return False
+
+
+class limits(object):
+    """Decorator applying limits to the requests handled by an action,
+    or by an `APIView` method. A limit of None is not enforced.
+
+    `max_body` is the size of the body, in bytes, `max_fields` the
+    number of fields of the query string and of an urlencoded body,
+    `max_depth` the nesting depth of a JSON body, `max_headers` and
+    `max_header_size` the number and total size of the headers.
+    """
+
+    def __init__(self, max_body=None, max_fields=None, max_depth=None,
+                 max_headers=None, max_header_size=None,
+                 chunk_size=STREAM_CHUNKSIZE):
+        self.max_body = max_body
+        self.max_fields = max_fields
+        self.max_depth = max_depth
+        self.max_headers = max_headers
+        self.max_header_size = max_header_size
+        self.chunk_size = chunk_size
+
+    def check_headers(self, environ):
+        if self.max_headers is None and self.max_header_size is None:
+            return True
+        count = size = 0
+        for key, value in environ.items():
+            if key.startswith('HTTP_'):
+                count += 1
+                size += len(key) - 5 + len(value)
+        if self.max_headers is not None and count > self.max_headers:
+            return False
+        if self.max_header_size is not None and size > self.max_header_size:
+            return False
+        return True
+
+    def check_body(self, environ):
+        """Checks the body, reading it beforehand if it is parsed at
+        once. Returns False if it exceeds the limits.
+        """
+        content_type = environ.get('CONTENT_TYPE', '').partition(
+            ';')[0].strip().lower()
+        buffered = content_type in BUFFERED_TYPES and (
+            self.max_body is not None or self.max_fields is not None or
+            self.max_depth is not None)
+
+        if environ.get('HTTP_TRANSFER_ENCODING', '').lower() == 'chunked':
+            length = None
+        else:
+            try:
+                length = int(environ.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                return False
+
+        if self.max_body is not None:
+            if length is not None and length > self.max_body:
+                return False
+            if not buffered:
+                environ['wsgi.input'] = LimitedInput(
+                    environ['wsgi.input'], self.max_body, length)
+                return True
+
+        if not buffered:
+            return True
+
+        if self.max_body is not None:
+            body = read_body(environ['wsgi.input'], self.max_body,
+                             self.chunk_size, length)
+        elif length is not None:
+            body = environ['wsgi.input'].read(length)
+        else:
+            body = environ['wsgi.input'].read()
+        environ['wsgi.input'] = BytesIO(body)
+        environ['CONTENT_LENGTH'] = str(len(body))
+        environ.pop('HTTP_TRANSFER_ENCODING', None)
+
+        if content_type == 'application/json':
+            if self.max_depth is not None:
+                return json_depth(body, self.max_depth) <= self.max_depth
+        elif self.max_fields is not None:
+            return count_fields(body) <= self.max_fields
+        return True
+
+    def check(self, environ):
+        """Returns the reply to a request exceeding the limits, or None.
+        """
+        if not self.check_headers(environ):
+            return static_reply(431)
+        if self.max_fields is not None and count_fields(
+                environ.get('QUERY_STRING', '')) > self.max_fields:
+            return static_reply(413)
+        if has_body(environ):
+            try:
+                if not self.check_body(environ):
+                    return static_reply(413)
+            except BodyTooLarge:
+                return static_reply(413)
+        return None
+
+    def __call__(self, action):
+
+        def too_large(error):
+            if isinstance(error, BodyTooLarge):
+                return static_reply(413)
+            raise error
+
+        @wraps(action)
+        def limited_action(*args):
+            response = self.check(handler_environ(args))
+            if response is not None:
+                return response
+            try:
+                response = action(*args)
+            except BodyTooLarge:
+                return static_reply(413)
+            return then(response, lambda response: response, too_large)
+        return limited_action
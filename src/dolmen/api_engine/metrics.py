@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of the request processing.
+
+The layers of the engine time their stages, when hooks are registered :
+
+  - routing : the lookup of the endpoint by the node,
+  - auth : the authentication of the request,
+  - extraction and validation : the parsing of the parameters and
+    their validation, by `validate`,
+  - handler : the action or view method, under `validate`,
+  - endpoint : the endpoint processed by the node, decorators included,
+  - response : the call of the response, as a WSGI application,
+  - request : the whole request handled by the node, with its status.
+
+A hook is called as `hook(stage, duration, environ, status)`, the
+duration being in seconds and the status only given for the request.
+Without hooks, the instrumentation costs a test per stage.
+
+`Metrics` is a hook recording the durations in histograms, per stage
+and endpoint, exported in the Prometheus text format.
+"""
+
+import threading
+from time import perf_counter
+
+from .responder import reply
+
+
+HOOKS = []
+
+# The endpoint handling the request, as a label for the metrics.
+ENDPOINT_KEY = 'dolmen.api_engine.endpoint'
+
+
+def add_hook(hook):
+    HOOKS.append(hook)
+
+
+def remove_hook(hook):
+    HOOKS.remove(hook)
+
+
+def notify(stage, environ, started, status=None):
+    duration = perf_counter() - started
+    for hook in HOOKS:
+        hook(stage, duration, environ, status)
+
+
+class Histogram(object):
+    """Log-linear histogram of positive integers, such as durations in
+    microseconds, in the manner of HdrHistogram : the values sharing
+    their `significant_bits` highest bits share a bucket, which bounds
+    the relative error of the quantiles to 2 ** (1 - significant_bits).
+    """
+
+    def __init__(self, significant_bits=7):
+        self.bits = significant_bits
+        self.linear = 1 << significant_bits
+        self.half = self.linear >> 1
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def index(self, value):
+        if value < self.linear:
+            return value
+        shift = value.bit_length() - self.bits
+        return self.linear + (shift - 1) * self.half + (
+            (value >> shift) - self.half)
+
+    def upper_bound(self, index):
+        if index < self.linear:
+            return index
+        shift, offset = divmod(index - self.linear, self.half)
+        shift += 1
+        return ((self.half + offset + 1) << shift) - 1
+
+    def record(self, value):
+        value = int(value)
+        index = self.index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        if not self.count:
+            return 0
+        rank = max(1, q * self.count)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.upper_bound(index), self.max)
+        return self.max
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace(
+        '\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels):
+    return ','.join('%s="%s"' % (name, escape_label(value))
+                    for name, value in labels)
+
+
+class Metrics(object):
+    """Hook recording the durations of the stages per endpoint, and of
+    the requests per endpoint and status, in microseconds.
+
+        metrics = Metrics()
+        add_hook(metrics)
+
+    `endpoint` serves the metrics, in the Prometheus text format, and
+    can be routed by a node.
+    """
+    quantiles = (0.5, 0.9, 0.99, 0.999)
+
+    def __init__(self, prefix='dolmen_api', significant_bits=7):
+        self.prefix = prefix
+        self.significant_bits = significant_bits
+        self.stages = {}
+        self.requests = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, stage, duration, environ, status=None):
+        endpoint = environ.get(ENDPOINT_KEY, '')
+        if stage == 'request':
+            histograms, key = self.requests, (endpoint, status or '')
+        else:
+            histograms, key = self.stages, (stage, endpoint)
+        with self.lock:
+            histogram = histograms.get(key)
+            if histogram is None:
+                histogram = histograms[key] = Histogram(
+                    self.significant_bits)
+            histogram.record(duration * 1e6)
+
+    def histogram(self, stage, endpoint='', status=None):
+        if stage == 'request':
+            return self.requests.get((endpoint, status or ''))
+        return self.stages.get((stage, endpoint))
+
+    def clear(self):
+        with self.lock:
+            self.stages.clear()
+            self.requests.clear()
+
+    def summary(self, name, help, series):
+        lines = ['# HELP %s %s' % (name, help),
+                 '# TYPE %s summary' % name]
+        for labels, histogram in series:
+            for q in self.quantiles:
+                lines.append('%s{%s} %.6f' % (
+                    name, format_labels(labels + [('quantile', q)]),
+                    histogram.quantile(q) / 1e6))
+            lines.append('%s_sum{%s} %.6f' % (
+                name, format_labels(labels), histogram.total / 1e6))
+            lines.append('%s_count{%s} %d' % (
+                name, format_labels(labels), histogram.count))
+        return lines
+
+    def export(self):
+        """Returns the metrics in the Prometheus text format.
+        """
+        with self.lock:
+            stages = [([('stage', stage), ('endpoint', endpoint)], histogram)
+                      for (stage, endpoint), histogram
+                      in sorted(self.stages.items())]
+            requests = [([('endpoint', endpoint), ('status', status)],
+                         histogram)
+                        for (endpoint, status), histogram
+                        in sorted(self.requests.items())]
+            lines = self.summary(
+                self.prefix + '_stage_seconds',
+                'Duration of the stages of the request processing.', stages)
+            lines.extend(self.summary(
+                self.prefix + '_request_seconds',
+                'Duration of the requests.', requests))
+        return '\n'.join(lines) + '\n'
+
+    def endpoint(self, environ, overhead):
+        return reply(200, text=self.export(),
+                     content_type='text/plain; version=0.0.4')
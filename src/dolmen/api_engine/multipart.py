@@ -0,0 +1,492 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming parser of the multipart/form-data bodies.
+
+The body is read from `wsgi.input` in chunks and parsed by a state
+machine looking for the boundaries. The file parts are written to
+temporary files of the destination directory by a `Spooler` thread,
+while the next chunks are received, the memory used being bounded by
+the chunk size, whatever the size of the uploads. The text fields are
+kept, to be validated, up to `max_fields` fields and `max_form_size`
+bytes.
+
+The digests are the git blob digests of `persist_files` and of the
+`BlobStore`. Their header needs the size of the file, which is taken
+from the Content-Length of the part or, as browsers do not send it,
+guessed from the one of the request : the last part ends with the
+closing delimiter. The parts are hashed while they are written, by the
+spooler thread, and read back only when the guess was wrong.
+"""
+
+import hashlib
+import os
+import re
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from .components import handler_environ, then
+from .context import RequestContext
+from .limits import BodyTooLarge
+from .responder import reply, static_reply
+from .upload import BUFFERSIZE, clean_filename, digest, hash_factory
+
+
+MAX_FIELD_SIZE = 1024 * 1024
+MAX_FORM_SIZE = 8 * 1024 * 1024
+MAX_FIELDS = 1000
+MAX_HEADER_SIZE = 16 * 1024
+
+OPTION = re.compile(r';\s*([^\s=;]+)\s*=\s*("(?:[^"\\]|\\.)*"|[^;]*)')
+
+PREAMBLE, BOUNDARY, HEADERS, BODY, END = range(5)
+
+
+class MultipartError(ValueError):
+    """The body is not a valid multipart/form-data body.
+    """
+
+
+def parse_options(value):
+    """Returns the lowercased value and the options of a header such as
+    Content-Type or Content-Disposition.
+    """
+    main, sep, rest = value.partition(';')
+    options = {}
+    for match in OPTION.finditer(sep + rest):
+        option = match.group(2).strip()
+        if option.startswith('"'):
+            option = option[1:-1].replace('\\"', '"')
+        options[match.group(1).lower()] = option
+    return main.strip().lower(), options
+
+
+def decode_header(block):
+    """Part headers are sent in UTF-8 by the browsers, in latin-1 by
+    older clients.
+    """
+    try:
+        return block.decode('utf-8')
+    except UnicodeDecodeError:
+        return block.decode('latin-1')
+
+
+class Upload(object):
+    """A file part, spooled to a temporary file of the destination.
+    """
+
+    def __init__(self, name, filename, content_type, path, digest, size):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.path = path
+        self.digest = digest
+        self.size = size
+        self.persisted = False
+
+    def persist(self, filename=None):
+        """Renames the temporary file after its cleaned filename, in the
+        destination. Returns the new path.
+        """
+        path = os.path.join(os.path.dirname(self.path),
+                            clean_filename(filename or self.filename))
+        os.replace(self.path, path)
+        self.path = path
+        self.persisted = True
+        return path
+
+    def discard(self):
+        if not self.persisted and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def persist_uploads(uploads):
+    """Persists the uploads, skipping the duplicates, and yields (digest,
+    filename, size, date) for each persisted file, as `persist_files`.
+    """
+    digests = set()
+    for upload in uploads:
+        if upload.digest in digests:
+            upload.discard()
+            continue
+        digests.add(upload.digest)
+        path = upload.persist()
+        yield (upload.digest, os.path.basename(path), upload.size,
+               int(time.time()))
+
+
+class SpooledFile(object):
+    """The temporary file of an upload, written and hashed by the
+    spooler thread, given its expected `size`.
+    """
+
+    def __init__(self, upload, hash, size=None, chunk_size=BUFFERSIZE):
+        self.upload = upload
+        self.hash = hash
+        self.size = size
+        self.chunk_size = chunk_size
+        self.file = None
+        self.hashobj = None
+        self.written = 0
+
+    def open(self):
+        self.file = open(self.upload.path, 'xb')
+        if self.size is not None:
+            self.hashobj = self.hash()
+            self.hashobj.update(b"blob %i\0" % self.size)
+
+    def write(self, data):
+        self.file.write(data)
+        self.written += len(data)
+        if self.hashobj is not None:
+            if self.written > self.size:
+                # Larger than expected : hashed once written.
+                self.hashobj = None
+            else:
+                self.hashobj.update(data)
+
+    def close(self):
+        self.file.close()
+        if self.hashobj is not None and self.written == self.size:
+            self.upload.digest = self.hashobj.hexdigest()
+        else:
+            with open(self.upload.path, 'rb') as fd:
+                self.upload.digest = digest(
+                    fd, hash=self.hash, chunk_size=self.chunk_size)
+
+    def abort(self):
+        if self.file is not None:
+            self.file.close()
+        self.upload.discard()
+
+
+class Spooler(object):
+    """Runs the writes and the hashing of the file parts, in order, in a
+    thread : the parser receives the next chunks meanwhile, hashlib and
+    the writes releasing the GIL. At most `pending` chunks wait to be
+    written, bounding the memory used.
+    """
+
+    def __init__(self, pending=4):
+        self.pending = pending
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.futures = deque()
+
+    def submit(self, func, *args):
+        self.futures.append(self.executor.submit(func, *args))
+        while self.futures and (
+                self.futures[0].done() or len(self.futures) > self.pending):
+            self.futures.popleft().result()
+
+    def wait(self):
+        while self.futures:
+            self.futures.popleft().result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.futures.clear()
+
+
+class MultipartParser(object):
+    """Parses a multipart/form-data body read from a stream, spooling
+    the file parts into the destination directory.
+
+    `parse` returns the text fields, as a dict of lists, and the
+    `Upload` of the file parts. Malformed bodies raise a
+    `MultipartError`, text fields exceeding `max_field_size`, or
+    `max_fields` and `max_form_size` all together, a `BodyTooLarge`,
+    the spooled files being removed.
+    """
+
+    def __init__(self, stream, boundary, destination, length=None,
+                 hash=hashlib.sha1, chunk_size=BUFFERSIZE,
+                 max_field_size=MAX_FIELD_SIZE, max_fields=MAX_FIELDS,
+                 max_form_size=MAX_FORM_SIZE,
+                 max_header_size=MAX_HEADER_SIZE, charset='utf-8'):
+        if not boundary:
+            raise MultipartError('Missing boundary.')
+        self.stream = stream
+        self.boundary = boundary.encode('latin-1')
+        self.destination = destination
+        self.length = length
+        self.hash = hash_factory(hash)
+        self.chunk_size = chunk_size
+        self.max_field_size = max_field_size
+        self.max_fields = max_fields
+        self.max_form_size = max_form_size
+        self.max_header_size = max_header_size
+        self.charset = charset
+        self.fields = {}
+        self.field_count = 0
+        self.form_size = 0
+        self.uploads = []
+        self.spooled = []
+        self.spooler = None
+        self.part = None
+        self.received = 0
+        self.closing = len(b'\r\n--%s--\r\n' % self.boundary)
+
+    def chunks(self):
+        remaining = self.length
+        while remaining is None or remaining > 0:
+            if remaining is None:
+                chunk = self.stream.read(self.chunk_size)
+            else:
+                chunk = self.stream.read(min(self.chunk_size, remaining))
+                remaining -= len(chunk)
+            if not chunk:
+                return
+            self.received += len(chunk)
+            yield chunk
+
+    def guess_size(self, offset):
+        """Returns the size of the part starting at `offset`, if it is
+        the last one, or None.
+        """
+        if self.length is None:
+            return None
+        size = self.length - offset - self.closing
+        return size if size >= 0 else None
+
+    def start_part(self, block, offset):
+        headers = {}
+        for line in decode_header(block).split('\r\n'):
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise MultipartError('Malformed part header.')
+            headers[name.strip().lower()] = value.strip()
+
+        disposition, options = parse_options(
+            headers.get('content-disposition', ''))
+        if disposition != 'form-data' or 'name' not in options:
+            raise MultipartError('Missing form-data disposition.')
+        content_type, type_options = parse_options(
+            headers.get('content-type', 'text/plain'))
+
+        if 'filename' not in options:
+            self.field_count += 1
+            if self.field_count > self.max_fields:
+                raise BodyTooLarge(self.max_fields)
+            self.part = {
+                'name': options['name'],
+                'charset': type_options.get('charset', self.charset),
+                'value': bytearray(),
+            }
+        elif options['filename']:
+            size = headers.get('content-length')
+            if size is not None:
+                if not size.isdigit():
+                    raise MultipartError('Invalid part Content-Length.')
+                size = int(size)
+                expected = size
+            else:
+                expected = self.guess_size(offset)
+            path = os.path.join(
+                self.destination, '.%s.part' % uuid.uuid4().hex)
+            upload = Upload(options['name'], options['filename'],
+                            content_type, path, None, 0)
+            spooled = SpooledFile(
+                upload, self.hash, expected, self.chunk_size)
+            self.spooled.append(spooled)
+            if self.spooler is None:
+                self.spooler = Spooler()
+            self.spooler.submit(spooled.open)
+            self.part = {'upload': upload, 'spooled': spooled, 'size': size}
+        else:
+            # A file input left empty.
+            self.part = {}
+
+    def feed(self, data):
+        part = self.part
+        if 'spooled' in part:
+            # The buffer is reused : the spooler gets a copy.
+            self.spooler.submit(part['spooled'].write, bytes(data))
+            part['upload'].size += len(data)
+        elif 'value' in part:
+            part['value'] += data
+            self.form_size += len(data)
+            if len(part['value']) > self.max_field_size:
+                raise BodyTooLarge(self.max_field_size)
+            if self.form_size > self.max_form_size:
+                raise BodyTooLarge(self.max_form_size)
+
+    def end_part(self):
+        part, self.part = self.part, None
+        if 'spooled' in part:
+            upload = part['upload']
+            if part['size'] is not None and part['size'] != upload.size:
+                raise MultipartError(
+                    'Part size does not match its Content-Length.')
+            self.spooler.submit(part['spooled'].close)
+            self.uploads.append(upload)
+        elif 'value' in part:
+            try:
+                value = part['value'].decode(part['charset'])
+            except (LookupError, UnicodeDecodeError):
+                raise MultipartError(
+                    'Undecodable field %r.' % part['name'])
+            self.fields.setdefault(part['name'], []).append(value)
+
+    def run(self):
+        first = b'--' + self.boundary
+        delimiter = b'\r\n--' + self.boundary
+        buffer = bytearray()
+        state = PREAMBLE
+
+        for chunk in self.chunks():
+            buffer += chunk
+            while True:
+                if state == PREAMBLE:
+                    position = buffer.find(first)
+                    if position < 0:
+                        del buffer[:max(0, len(buffer) - len(first))]
+                        break
+                    del buffer[:position + len(first)]
+                    state = BOUNDARY
+
+                elif state == BOUNDARY:
+                    if buffer[:2] == b'--':
+                        state = END
+                        break
+                    position = buffer.find(b'\r\n')
+                    if position < 0:
+                        if len(buffer) > self.max_header_size:
+                            raise MultipartError('Malformed boundary.')
+                        break
+                    if buffer[:position].strip(b' \t'):
+                        raise MultipartError('Malformed boundary.')
+                    del buffer[:position + 2]
+                    state = HEADERS
+
+                elif state == HEADERS:
+                    position = buffer.find(b'\r\n\r\n')
+                    if position < 0:
+                        if len(buffer) > self.max_header_size:
+                            raise MultipartError('Part headers too large.')
+                        break
+                    block = bytes(buffer[:position])
+                    del buffer[:position + 4]
+                    self.start_part(block, self.received - len(buffer))
+                    state = BODY
+
+                elif state == BODY:
+                    position = buffer.find(delimiter)
+                    if position < 0:
+                        # The end of the buffer may start a delimiter.
+                        size = len(buffer) - len(delimiter) + 1
+                        if size > 0:
+                            with memoryview(buffer) as view:
+                                self.feed(view[:size])
+                            del buffer[:size]
+                        break
+                    with memoryview(buffer) as view:
+                        self.feed(view[:position])
+                    del buffer[:position + len(delimiter)]
+                    self.end_part()
+                    state = BOUNDARY
+
+            if state == END:
+                return
+        raise MultipartError('Unexpected end of the body.')
+
+    def parse(self):
+        try:
+            self.run()
+            if self.spooler is not None:
+                self.spooler.wait()
+        except BaseException:
+            if self.spooler is not None:
+                self.spooler.shutdown()
+            for spooled in self.spooled:
+                spooled.abort()
+            raise
+        finally:
+            if self.spooler is not None:
+                self.spooler.shutdown()
+        return self.fields, self.uploads
+
+
+def parse_multipart(environ, destination, **options):
+    """Parses the multipart/form-data body of the request. Returns the
+    text fields, as a dict of lists, and the uploads.
+    """
+    content_type, type_options = parse_options(
+        environ.get('CONTENT_TYPE', ''))
+    if content_type != 'multipart/form-data':
+        raise MultipartError('Not a multipart/form-data body.')
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        raise MultipartError('Invalid Content-Length.')
+    if (not length and environ.get(
+            'HTTP_TRANSFER_ENCODING', '').lower() == 'chunked'):
+        length = None
+    parser = MultipartParser(
+        environ['wsgi.input'], type_options.get('boundary'), destination,
+        length=length, **options)
+    return parser.parse()
+
+
+class multipart(object):
+    """Decorator parsing the multipart/form-data bodies of the requests
+    of an action, or of an `APIView` method, while they are received.
+
+    The text fields are set as the form of the `RequestContext`, as
+    extracted by `validate`, and the uploads as its `uploads`. The
+    uploads which are not persisted by the action are removed.
+    """
+
+    def __init__(self, destination, hash=hashlib.sha1,
+                 chunk_size=BUFFERSIZE, max_field_size=MAX_FIELD_SIZE,
+                 max_fields=MAX_FIELDS, max_form_size=MAX_FORM_SIZE):
+        self.destination = destination
+        self.options = {
+            'hash': hash_factory(hash),
+            'chunk_size': chunk_size,
+            'max_field_size': max_field_size,
+            'max_fields': max_fields,
+            'max_form_size': max_form_size,
+        }
+
+    @staticmethod
+    def discard(uploads):
+        for upload in uploads:
+            upload.discard()
+
+    def __call__(self, action):
+
+        @wraps(action)
+        def multipart_action(*args):
+            environ = handler_environ(args)
+            context = RequestContext.from_environ(environ)
+            if context.content_type != 'multipart/form-data':
+                return action(*args)
+
+            try:
+                fields, uploads = parse_multipart(
+                    environ, self.destination, **self.options)
+            except MultipartError as error:
+                return reply(400, text=str(error))
+            except BodyTooLarge:
+                return static_reply(413)
+            context.form = fields
+            context.uploads = uploads
+
+            try:
+                response = action(*args)
+            except BaseException:
+                self.discard(uploads)
+                raise
+
+            def discarded(response):
+                self.discard(uploads)
+                return response
+
+            def failed(error):
+                self.discard(uploads)
+                raise error
+
+            return then(response, discarded, failed)
+        return multipart_action
@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 
+import os
 import mimetypes
 from random import randrange
 
 
+CHUNKSIZE = 64 * 1024
+CRLF = b'\r\n'
+
+
 def make_boundary():
     return ('----------ThIs_Is_tHe_bouNdaRY_%s$' %
             hex(randrange(10<<63, 10<<64)))
@@ -13,33 +18,107 @@ def get_content_type(filename):
     return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
 
 
-def encode_multipart_formdata(fields, files, boundary=make_boundary):
+def to_bytes(value, encoding='utf-8'):
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode(encoding)
+
+
+class FilePart(object):
+    """The content of a file part, read in chunks when streamed.
+    The value is either a binary file object, read from its current
+    position, or a path (`os.PathLike`), opened when streamed.
+    """
+
+    def __init__(self, value):
+        self.value = value
+        if isinstance(value, os.PathLike):
+            self.size = os.path.getsize(value)
+        else:
+            position = value.tell()
+            try:
+                end = os.fstat(value.fileno()).st_size
+            except (AttributeError, OSError, ValueError):
+                end = value.seek(0, os.SEEK_END)
+                value.seek(position)
+            self.size = end - position
+
+    def chunks(self, chunk_size=CHUNKSIZE):
+        if isinstance(self.value, os.PathLike):
+            fobj = open(self.value, 'rb')
+        else:
+            fobj = self.value
+        try:
+            remaining = self.size
+            while remaining > 0:
+                chunk = fobj.read(min(chunk_size, remaining))
+                if not chunk:
+                    raise IOError('File shorter than its announced size.')
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            if fobj is not self.value:
+                fobj.close()
+
+
+def stream_multipart_formdata(fields, files, boundary=make_boundary,
+                              chunk_size=CHUNKSIZE):
     """
     - fields is a sequence of (name, value).
-    - files is a sequence of (name, filename, value).
+    - files is a sequence of (name, filename, value), where value is
+      either the content (str or bytes), a binary file object or a path
+      (`os.PathLike`).
 
-    Returns (content_type, body) to make an http request.
+    Returns (content_type, content_length, chunks) where chunks is an
+    iterator of bytes. Files are read while iterating, with a constant
+    memory footprint : the length is computed from their sizes.
     """
     BOUNDARY = boundary()
-    CRLF = '\r\n'
-    L = []
+    delimiter = b'--' + BOUNDARY.encode('ascii') + CRLF
+    parts = []
 
     for (key, value) in fields:
-        L.append('--' + BOUNDARY)
-        L.append('Content-Disposition: form-data; name="%s"' % key)
-        L.append('')
-        L.append(value)
+        parts.append(delimiter + CRLF.join((
+            to_bytes('Content-Disposition: form-data; name="%s"' % key),
+            b'', to_bytes(value))) + CRLF)
 
     for (key, filename, value) in files:
-        L.append('--' + BOUNDARY)
-        L.append('Content-Disposition: form-data; name="%s"; filename="%s"' % (
-            key, filename))
-        L.append('Content-Type: %s' % get_content_type(filename))
-        L.append('')
-        L.append(value)
-
-    L.append('--' + BOUNDARY + '--')
-    L.append('')
-    body = CRLF.join(L)
+        parts.append(delimiter + CRLF.join((
+            to_bytes('Content-Disposition: form-data; '
+                     'name="%s"; filename="%s"' % (key, filename)),
+            to_bytes('Content-Type: %s' % get_content_type(filename)),
+            b'', b'')))
+        if isinstance(value, (str, bytes)):
+            parts.append(to_bytes(value))
+        else:
+            parts.append(FilePart(value))
+        parts.append(CRLF)
+
+    parts.append(b'--' + BOUNDARY.encode('ascii') + b'--' + CRLF)
+
+    content_length = sum(
+        part.size if isinstance(part, FilePart) else len(part)
+        for part in parts)
+
+    def chunks():
+        for part in parts:
+            if isinstance(part, FilePart):
+                yield from part.chunks(chunk_size)
+            else:
+                yield part
+
     content_type = 'multipart/form-data; boundary=%s' % BOUNDARY
-    return content_type, body
+    return content_type, content_length, chunks()
+
+
+def encode_multipart_formdata(fields, files, boundary=make_boundary):
+    """
+    - fields is a sequence of (name, value).
+    - files is a sequence of (name, filename, value).
+
+    Returns (content_type, body) to make an http request.
+    The body is built in memory, see `stream_multipart_formdata`.
+    """
+    content_type, content_length, chunks = stream_multipart_formdata(
+        fields, files, boundary=boundary)
+    return content_type, b''.join(chunks)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from inspect import isawaitable
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class Pool(object):
+    """Asynchronous pool of connections, to an identity provider for
+    instance. Connections are created on demand by the factory, which
+    can be a coroutine function, up to `size` connections.
+
+        async with pool.connection() as connection:
+            ...
+
+    A connection whose usage raised an error is discarded.
+
+    The pool is bound to the event loop using it. When used from another
+    loop, while idle, its connections are discarded and it is bound to
+    the new loop.
+    """
+
+    def __init__(self, factory, size=10, close=None, timeout=None):
+        self.factory = factory
+        self.size = size
+        self.closer = close
+        self.timeout = timeout
+        self.idle = deque()
+        self.created = 0
+        self.loop = None
+        self.semaphore = None
+
+    async def bind(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            if self.created > len(self.idle):
+                raise RuntimeError(
+                    'The pool is in use by another event loop.')
+            self.loop = loop
+            self.semaphore = asyncio.Semaphore(self.size)
+            await self.close()
+
+    async def acquire(self):
+        await self.bind()
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeout('No connection available.')
+        try:
+            if self.idle:
+                return self.idle.pop()
+            connection = self.factory()
+            if isawaitable(connection):
+                connection = await connection
+            self.created += 1
+            return connection
+        except BaseException:
+            self.semaphore.release()
+            raise
+
+    async def discard(self, connection):
+        self.created -= 1
+        if self.closer is not None:
+            closed = self.closer(connection)
+            if isawaitable(closed):
+                await closed
+
+    async def release(self, connection, discard=False):
+        try:
+            if discard:
+                await self.discard(connection)
+            else:
+                self.idle.append(connection)
+        finally:
+            self.semaphore.release()
+
+    @asynccontextmanager
+    async def connection(self):
+        connection = await self.acquire()
+        try:
+            yield connection
+        except BaseException:
+            await self.release(connection, discard=True)
+            raise
+        await self.release(connection)
+
+    async def close(self):
+        while self.idle:
+            await self.discard(self.idle.pop())
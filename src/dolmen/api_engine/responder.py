@@ -1,7 +1,15 @@
 # -*- coding: utf-8 -*-
 
+import json
+from collections.abc import Mapping
+
 from webob import exc, Response
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 HTTPRESPONSES = {
 #HTTP OK
@@ -65,6 +73,8 @@ HTTPRESPONSES = {
 }
 
 
+STREAM_CHUNKSIZE = 64 * 1024
+
 GENERIC_ERROR = exc.HTTPInternalServerError(
     'The server could not handle the request nor '
     'generate a readable error.')
@@ -80,3 +90,230 @@ def reply(code, text=None, charset='utf8', content_type='text/plain'):
                 text, status=code, content_type=content_type, charset=charset)
             return response
     return GENERIC_ERROR
+
+
+def dumps_json(data):
+    """Serializes the data to compact UTF-8 JSON.
+    """
+    return json.dumps(
+        data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def dumps_orjson(data):
+    """Serializes the data to compact UTF-8 JSON with orjson, if it is
+    installed (`json` extra). The data orjson rejects, such as the
+    namedtuples of `validate` or the integers beyond 64 bits, is
+    serialized by `dumps_json`. Opt-in, as the serializer of
+    `reply_json` and `stream_json`.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return dumps_json(data)
+
+
+def serialize(data, serializer=None):
+    body = (serializer or dumps_json)(data)
+    if isinstance(body, str):
+        return body.encode('utf-8')
+    return body
+
+
+def reply_json(code, data, serializer=None, headers=None):
+    """Returns a JSON response. The data is serialized straight to
+    bytes, by `dumps_json` or the given serializer, and used as the body
+    as is. Bytes are considered as pre-encoded JSON.
+    """
+    if code not in HTTPRESPONSES:
+        return GENERIC_ERROR
+    if isinstance(data, bytes):
+        body = data
+    else:
+        body = serialize(data, serializer)
+    response = Response(
+        body=body, status=code, content_type='application/json',
+        charset=None)
+    if headers:
+        response.headerlist.extend(headers)
+    return response
+
+
+def iter_json(items, ndjson=False, serializer=None,
+              chunk_size=STREAM_CHUNKSIZE):
+    """Serializes the items one by one, as a JSON array or as
+    newline delimited JSON, and yields chunks of about `chunk_size`
+    bytes. The items iterator is closed when the iteration stops.
+    """
+    if ndjson:
+        opening, separator, closing = b'', b'\n', b'\n'
+    else:
+        opening, separator, closing = b'[', b',', b']'
+    buffer = bytearray(opening)
+    try:
+        first = True
+        for item in items:
+            if first:
+                first = False
+            else:
+                buffer += separator
+            buffer += serialize(item, serializer)
+            if len(buffer) >= chunk_size:
+                yield bytes(buffer)
+                buffer.clear()
+        if not (ndjson and first):
+            buffer += closing
+        if buffer:
+            yield bytes(buffer)
+    finally:
+        close = getattr(items, 'close', None)
+        if close is not None:
+            close()
+
+
+def stream_json(code, items, ndjson=False, serializer=None,
+                chunk_size=STREAM_CHUNKSIZE, headers=None):
+    """Returns a JSON response streaming the items, serialized while
+    the body is iterated : the memory used does not depend on the number
+    of items. There is no Content-Length, the server chunks the body.
+
+    The status and the headers are sent before the first item is
+    produced : errors raised by the items can only abort the response.
+    """
+    if code not in HTTPRESPONSES:
+        return GENERIC_ERROR
+    response = Response(
+        status=code, charset=None,
+        content_type=ndjson and 'application/x-ndjson' or 'application/json',
+        app_iter=iter_json(items, ndjson, serializer, chunk_size))
+    if headers:
+        response.headerlist.extend(headers)
+    return response
+
+
+# Explanations of the static replies, where the WebOb ones depend on the
+# request.
+EXPLANATIONS = {
+    405: 'The method is not allowed for this resource.',
+}
+
+
+class StaticHeaders(Mapping):
+    """Read-only, case insensitive view of the headers of a static
+    reply. The replies are shared : `with_headers` returns a copy with
+    other headers.
+    """
+    __slots__ = ('headerlist',)
+
+    def __init__(self, headerlist):
+        self.headerlist = headerlist
+
+    def __getitem__(self, name):
+        name = name.lower()
+        for key, value in self.headerlist:
+            if key.lower() == name:
+                return value
+        raise KeyError(name)
+
+    def __iter__(self):
+        return iter([key for key, value in self.headerlist])
+
+    def __len__(self):
+        return len(self.headerlist)
+
+    def __setitem__(self, name, value):
+        raise TypeError(
+            'Static replies are shared, use `with_headers` to add headers.')
+
+    __delitem__ = __setitem__
+
+
+class StaticReply(object):
+    """A response rendered once, served as a tiny WSGI application,
+    without any WebOb allocation. It is shared and must not be modified.
+    """
+    __slots__ = ('code', 'status', 'status_int', 'headerlist', 'body')
+
+    @property
+    def headers(self):
+        return StaticHeaders(self.headerlist)
+
+    def __init__(self, code, text=None, content_type='text/plain',
+                 charset='utf8', headers=()):
+        factory = HTTPRESPONSES[code]
+        headerlist = []
+        if factory.empty_body:
+            body = b''
+        else:
+            if text is None:
+                explanation = EXPLANATIONS.get(code, factory.explanation)
+                text = '%d %s' % (code, factory.title)
+                if explanation:
+                    text += '\n\n' + explanation
+            body = text.encode(charset)
+            headerlist.append(
+                ('Content-Type', '%s; charset=%s' % (content_type, charset)))
+            headerlist.append(('Content-Length', str(len(body))))
+        headerlist.extend(headers)
+        self.code = self.status_int = code
+        self.status = '%d %s' % (code, factory.title)
+        self.headerlist = tuple(headerlist)
+        self.body = body
+
+    @classmethod
+    def snapshot(cls, response):
+        """Returns a static copy of a WebOb response with a complete
+        body.
+        """
+        reply = cls.__new__(cls)
+        reply.code = reply.status_int = response.status_int
+        reply.status = response.status
+        reply.headerlist = tuple(response.headerlist)
+        reply.body = response.body
+        return reply
+
+    def with_headers(self, headers):
+        """Returns a copy of the reply, with the given headers set.
+        """
+        names = set(name.lower() for name, value in headers)
+        reply = self.__class__.__new__(self.__class__)
+        reply.code = reply.status_int = self.code
+        reply.status = self.status
+        reply.headerlist = tuple(
+            header for header in self.headerlist
+            if header[0].lower() not in names) + tuple(headers)
+        reply.body = self.body
+        return reply
+
+    def __call__(self, environ, start_response):
+        start_response(self.status, list(self.headerlist))
+        if not self.body or environ['REQUEST_METHOD'] == 'HEAD':
+            return ()
+        return (self.body,)
+
+
+# Pre-rendered responses, by (code, text, content_type, charset).
+STATIC_REPLIES = {}
+
+
+def register_static_reply(code, text=None, content_type='text/plain',
+                          charset='utf8'):
+    response = StaticReply(code, text, content_type, charset)
+    STATIC_REPLIES[code, text, content_type, charset] = response
+    return response
+
+
+def static_reply(code, text=None, content_type='text/plain', charset='utf8'):
+    """Returns the pre-rendered response, for the bare codes and the
+    registered texts. Other replies are created by `reply`.
+    """
+    response = STATIC_REPLIES.get((code, text, content_type, charset))
+    if response is None:
+        return reply(code, text, charset=charset, content_type=content_type)
+    return response
+
+
+for code in HTTPRESPONSES:
+    if code:
+        register_static_reply(code)
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled prefix tree router.
+
+Routes are declared as paths where a segment can capture a typed
+parameter, using the `{name}` or `{name:type}` syntax:
+
+    /users/{username}/details
+    /documents/{docid:int}
+    /static/{filepath:path}
+
+The routes are compiled into a segment based radix tree : static
+segments are looked up in a dict and chains of static segments are
+collapsed into a single edge. The lookup cost only depends on the
+length of the requested path, not on the number of routes.
+"""
+
+import re
+from collections import namedtuple
+from uuid import UUID
+
+from .components import APINode
+from .metrics import HOOKS, ENDPOINT_KEY
+
+
+Match = namedtuple('Match', ('endpoint', 'params', 'pattern'))
+
+PARAMETER = re.compile(r'^{(?P<name>\w+)(?::(?P<type>\w+))?}$')
+
+
+def convert_str(segment):
+    if not segment:
+        raise ValueError('Empty segment.')
+    return segment
+
+
+def convert_int(segment):
+    if not segment.isdigit():
+        raise ValueError('%r is not an integer.' % segment)
+    return int(segment)
+
+
+def convert_float(segment):
+    if not segment or segment.strip() != segment:
+        raise ValueError('%r is not a float.' % segment)
+    return float(segment)
+
+
+def convert_uuid(segment):
+    return UUID(segment)
+
+
+CONVERTERS = {
+    'str': convert_str,
+    'int': convert_int,
+    'float': convert_float,
+    'uuid': convert_uuid,
+    'path': None,  # Catch-all : consumes the remaining segments.
+}
+
+
+class RouteNode(object):
+    """A node of the routing tree.
+
+    `statics` maps the first segment of an edge to the full edge (a tuple
+    of static segments) and the child node. `params` is a sequence of
+    (name, converter, child) for the typed parameters.
+    """
+    __slots__ = ('statics', 'params', 'wildcard', 'endpoint', 'pattern')
+
+    def __init__(self):
+        self.statics = {}
+        self.params = []
+        self.wildcard = None
+        self.endpoint = None
+        self.pattern = None
+
+    def compress(self):
+        """Collapse the chains of static nodes into single edges.
+        """
+        statics = {}
+        for segment, (edge, child) in self.statics.items():
+            while (len(child.statics) == 1 and not child.params and
+                   child.wildcard is None and child.endpoint is None):
+                (subedge, grandchild), = child.statics.values()
+                edge = edge + subedge
+                child = grandchild
+            child.compress()
+            statics[segment] = (edge, child)
+        self.statics = statics
+        for name, converter, child in self.params:
+            child.compress()
+
+
+def split_path(path):
+    if not path.startswith('/'):
+        raise ValueError('Path must start with a slash: %r' % path)
+    return tuple(path[1:].split('/'))
+
+
+class Router(object):
+    """Maps path patterns to endpoints.
+    """
+
+    def __init__(self, routes=None, converters=CONVERTERS):
+        self.converters = converters
+        self.root = RouteNode()
+        self.compiled = False
+        if routes:
+            items = routes.items() if hasattr(routes, 'items') else routes
+            for pattern, endpoint in items:
+                self.add(pattern, endpoint)
+
+    def parse(self, pattern):
+        """Returns the (name, type) of each segment of the pattern.
+        Static segments have no type.
+        """
+        segments = split_path(pattern)
+        parsed = []
+        for idx, segment in enumerate(segments):
+            param = PARAMETER.match(segment)
+            if param is None:
+                parsed.append((segment, None))
+                continue
+            name, type_ = param.group('name'), param.group('type') or 'str'
+            if type_ not in self.converters:
+                raise ValueError('Unknown parameter type %r in %r.' % (
+                    type_, pattern))
+            if type_ == 'path' and idx != len(segments) - 1:
+                raise ValueError(
+                    'A path parameter must be the last segment: %r' % pattern)
+            parsed.append((name, type_))
+        return parsed
+
+    def add(self, pattern, endpoint):
+        node = self.root
+        for name, type_ in self.parse(pattern):
+            if type_ is None:
+                entry = node.statics.get(name)
+                if entry is None:
+                    entry = node.statics[name] = ((name,), RouteNode())
+                elif len(entry[0]) > 1:
+                    raise RuntimeError(
+                        'Routes can not be added to a compiled router.')
+                node = entry[1]
+            elif type_ == 'path':
+                if node.wildcard is None:
+                    node.wildcard = (name, RouteNode())
+                elif node.wildcard[0] != name:
+                    raise ValueError(
+                        'Conflicting wildcard names in %r.' % pattern)
+                node = node.wildcard[1]
+            else:
+                converter = self.converters[type_]
+                for pname, pconverter, child in node.params:
+                    if pconverter is converter:
+                        if pname != name:
+                            raise ValueError(
+                                'Conflicting parameter names in %r.'
+                                % pattern)
+                        node = child
+                        break
+                else:
+                    child = RouteNode()
+                    node.params.append((name, converter, child))
+                    node = child
+
+        if node.endpoint is not None:
+            raise ValueError('Route %r is already registered.' % pattern)
+        node.endpoint = endpoint
+        node.pattern = pattern
+        self.compiled = False
+
+    def compile(self):
+        self.root.compress()
+        self.compiled = True
+
+    def _match(self, node, segments, idx, params):
+        if idx == len(segments):
+            if node.endpoint is not None:
+                return node
+        else:
+            segment = segments[idx]
+            entry = node.statics.get(segment)
+            if entry is not None:
+                edge, child = entry
+                end = idx + len(edge)
+                if len(edge) == 1 or segments[idx:end] == edge:
+                    found = self._match(child, segments, end, params)
+                    if found is not None:
+                        return found
+
+            for name, converter, child in node.params:
+                try:
+                    params[name] = converter(segment)
+                except ValueError:
+                    continue
+                found = self._match(child, segments, idx + 1, params)
+                if found is not None:
+                    return found
+                del params[name]
+
+        if node.wildcard is not None:
+            name, child = node.wildcard
+            if child.endpoint is not None and idx < len(segments):
+                params[name] = '/'.join(segments[idx:])
+                return child
+        return None
+
+    def match(self, path):
+        """Returns a `Match` or None if no route matches the path.
+        Static segments take precedence over parameters, which take
+        precedence over path wildcards.
+        """
+        if not self.compiled:
+            self.compile()
+        params = {}
+        node = self._match(self.root, split_path(path), 0, params)
+        if node is None:
+            return None
+        return Match(node.endpoint, params, node.pattern)
+
+
+class RouterNode(APINode):
+    """An `APINode` dispatching on a compiled route table.
+    The endpoints are actions or `APIView` instances, called with the
+    environ and the overhead. The captured path parameters are available
+    in the environ, under the `wsgiorg.routing_args` key.
+    """
+
+    def __init__(self, routes, converters=CONVERTERS):
+        self.router = Router(routes, converters=converters)
+        self.router.compile()
+
+    def lookup(self, path_info, environ):
+        try:
+            match = self.router.match(path_info)
+        except ValueError:
+            return None
+        if match is not None and HOOKS:
+            environ[ENDPOINT_KEY] = match.pattern
+        return match
+
+    def allowed_methods(self, routing_args):
+        return getattr(routing_args.endpoint, 'allowed_methods', None)
+
+    def overhead(self, environ, routing_args):
+        """Returns the overhead given to the endpoint.
+        """
+        return None
+
+    def process_endpoint(self, environ, routing_args):
+        environ['wsgiorg.routing_args'] = ((), routing_args.params)
+        return routing_args.endpoint(
+            environ, self.overhead(environ, routing_args))
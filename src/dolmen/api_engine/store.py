@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from .upload import digest, clean_filename
+
+
+Blob = namedtuple(
+    'Blob', ('digest', 'size', 'refs', 'created', 'filename', 'content_type'))
+
+HEXDIGEST = re.compile(r'^[0-9a-f]{8,128}$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    refs INTEGER NOT NULL,
+    created REAL NOT NULL,
+    filename TEXT,
+    content_type TEXT
+)
+"""
+
+
+class BlobStore(object):
+    """Content addressed storage of uploaded files.
+
+    Blobs are stored once, under their digest, in sharded directories
+    (`ab/cdef...`). A sqlite index, shared by all the processes using
+    the same root, maps the digests to the metadata of the blobs and
+    counts their references : storing a known content only costs its
+    digest.
+    """
+    index_name = 'index.sqlite'
+
+    def __init__(self, root, hash=hashlib.sha1):
+        self.root = root
+        self.hash = hash
+        os.makedirs(root, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(
+            os.path.join(root, self.index_name),
+            isolation_level=None, check_same_thread=False)
+        self.db.execute(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def path(self, digested):
+        if HEXDIGEST.match(digested) is None:
+            raise ValueError('Invalid digest: %r' % digested)
+        return os.path.join(self.root, digested[:2], digested[2:])
+
+    def get(self, digested):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT * FROM blobs WHERE digest = ?',
+                (digested,)).fetchone()
+        if row is None:
+            return None
+        return Blob(*row)
+
+    def __contains__(self, digested):
+        return self.get(digested) is not None
+
+    def open(self, digested):
+        return open(self.path(digested), 'rb')
+
+    def _reference(self, digested):
+        with self.lock:
+            updated = self.db.execute(
+                'UPDATE blobs SET refs = refs + 1 WHERE digest = ?',
+                (digested,)).rowcount
+        return bool(updated)
+
+    def add(self, fobj, filename=None, content_type=None):
+        """Stores the content of the file object, unless it is known.
+        Returns the blob and whether it was written.
+        """
+        digested = digest(fobj, hash=self.hash)
+        if self._reference(digested):
+            return self.get(digested), False
+
+        path = self.path(digested)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmppath = '%s.%s.part' % (path, uuid.uuid4().hex)
+        try:
+            with open(tmppath, 'xb') as blob:
+                shutil.copyfileobj(fobj, blob)
+                size = blob.tell()
+            os.replace(tmppath, path)
+        except BaseException:
+            if os.path.exists(tmppath):
+                os.unlink(tmppath)
+            raise
+
+        with self.lock:
+            # Another process may have stored the same content meanwhile.
+            self.db.execute(
+                'INSERT INTO blobs VALUES (?, ?, 1, ?, ?, ?) '
+                'ON CONFLICT(digest) DO UPDATE SET refs = refs + 1',
+                (digested, size, time.time(), filename, content_type))
+        return self.get(digested), True
+
+    def release(self, digested):
+        """Removes a reference to the blob, deleting it once unreferenced.
+        Returns the number of remaining references.
+        """
+        path = self.path(digested)
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.db.execute(
+                    'SELECT refs FROM blobs WHERE digest = ?',
+                    (digested,)).fetchone()
+                if row is None:
+                    raise KeyError(digested)
+                refs = row[0] - 1
+                if refs:
+                    self.db.execute(
+                        'UPDATE blobs SET refs = ? WHERE digest = ?',
+                        (refs, digested))
+                else:
+                    self.db.execute(
+                        'DELETE FROM blobs WHERE digest = ?', (digested,))
+                    if os.path.exists(path):
+                        os.unlink(path)
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+            self.db.execute('COMMIT')
+        return refs
+
+    def persist(self, *files):
+        """Stores the uploaded files, as `persist_files` does, and yields
+        (digest, filename, size, date) for each of them.
+        """
+        for item in files:
+            filename = clean_filename(item.filename)
+            blob, written = self.add(
+                item.file, filename=filename,
+                content_type=getattr(item, 'type', None))
+            yield (blob.digest, filename, blob.size, int(blob.created))
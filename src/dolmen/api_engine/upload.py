@@ -1,13 +1,24 @@
 # -*- coding: utf-8 -*-
 
 import hashlib
+import mimetypes
 import os
 import shutil
-from stat import ST_SIZE, ST_CTIME
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from stat import ST_SIZE, ST_CTIME, ST_MTIME
+
+from .compression import negotiate
+from .context import RequestContext
+from .responder import HTTPRESPONSES
 
 
 CHUNKSIZE = 4096
+BUFFERSIZE = 256 * 1024
 INNER_ENCODING = 'utf-8'
+PRECOMPRESSED_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
 REWIND = object()
 CLOSE = object()
 
@@ -36,27 +47,204 @@ def chunk_reader(fobj, chunk_size=CHUNKSIZE):
 
 
 class FileIterable(object):
+    """Iterates over the bytes of a file, or of the [start, end) range of
+    the file, reading them into a reused buffer.
+    """
 
-    def __init__(self, filename, filepath):
-         self.filename = filename
-         self.filepath = filepath
+    def __init__(self, filename, filepath, start=0, end=None,
+                 buffer_size=BUFFERSIZE):
+        self.filename = filename
+        self.filepath = filepath
+        self.start = start
+        self.end = end
+        self.buffer_size = buffer_size
 
     def __iter__(self):
-        with open(self.filepath, 'rb') as fd:
-            for chunk in chunk_reader(fd):
-                yield chunk
+        buffer = memoryview(bytearray(self.buffer_size))
+        with open(self.filepath, 'rb', buffering=0) as fd:
+            if self.start:
+                fd.seek(self.start)
+            if self.end is None:
+                remaining = float('inf')
+            else:
+                remaining = self.end - self.start
+            while remaining > 0:
+                if remaining < self.buffer_size:
+                    read = fd.readinto(buffer[:remaining])
+                else:
+                    read = fd.readinto(buffer)
+                if not read:
+                    return
+                remaining -= read
+                yield bytes(buffer[:read])
+
+
+class FileResponse(object):
+    """WSGI application serving a file.
+
+    The whole file is handed to the `wsgi.file_wrapper` of the server,
+    if any, allowing it to use `sendfile`. Single byte ranges are served
+    as partial content.
+
+    Given `precompressed` encodings, such as ('br', 'gzip'), the
+    compressed siblings of the file (`.br`, `.gz`) accepted by the
+    client are served instead of the file, unless they are older.
+    """
+
+    def __init__(self, filepath, filename=None, content_type=None,
+                 buffer_size=BUFFERSIZE, precompressed=()):
+        self.filepath = filepath
+        self.filename = filename or os.path.basename(filepath)
+        self.content_type = content_type or (
+            mimetypes.guess_type(self.filename)[0] or
+            'application/octet-stream')
+        self.buffer_size = buffer_size
+        self.precompressed = tuple(precompressed)
+
+    def sibling(self, environ, mtime):
+        """Returns the (encoding, path, size) of the best precompressed
+        sibling accepted by the client, or None.
+        """
+        siblings = {}
+        for encoding in self.precompressed:
+            path = self.filepath + PRECOMPRESSED_SUFFIXES[encoding]
+            try:
+                stats = os.stat(path)
+            except OSError:
+                continue
+            if stats[ST_MTIME] >= mtime:
+                siblings[encoding] = (encoding, path, stats[ST_SIZE])
+        if siblings:
+            encoding = negotiate(
+                environ.get('HTTP_ACCEPT_ENCODING'), tuple(siblings))
+            if encoding is not None:
+                return siblings[encoding]
+        return None
+
+    def serve(self, environ, response, filepath, size):
+        if environ['REQUEST_METHOD'] != 'HEAD':
+            file_wrapper = environ.get('wsgi.file_wrapper')
+            if file_wrapper is not None:
+                response.app_iter = file_wrapper(
+                    open(filepath, 'rb'), self.buffer_size)
+            else:
+                response.app_iter = FileIterable(
+                    self.filename, filepath, buffer_size=self.buffer_size)
+        # Setting the iterable resets the length.
+        response.content_length = size
+
+    def __call__(self, environ, start_response):
+        request = RequestContext.from_environ(environ).request
+        stats = os.stat(self.filepath)
+        size = stats[ST_SIZE]
+
+        response = HTTPRESPONSES[200](
+            content_type=self.content_type, charset=None)
+        response.last_modified = stats[ST_MTIME]
+        response.accept_ranges = 'bytes'
+
+        # WebOb keeps the first of multiple ranges : they are ignored,
+        # and the whole file is served.
+        byte_range = None
+        if ',' not in environ.get('HTTP_RANGE', ''):
+            byte_range = request.range
+
+        if self.precompressed:
+            response.vary = ('Accept-Encoding',)
+            if byte_range is None:
+                sibling = self.sibling(environ, stats[ST_MTIME])
+                if sibling is not None:
+                    encoding, path, size = sibling
+                    response.content_encoding = encoding
+                    self.serve(environ, response, path, size)
+                    return response(environ, start_response)
+
+        if byte_range is not None and response in request.if_range:
+            bounds = byte_range.range_for_length(size)
+            if bounds is None:
+                response = HTTPRESPONSES[416]()
+                response.headers['Content-Range'] = 'bytes */%d' % size
+                return response(environ, start_response)
+
+            start, end = bounds
+            response = HTTPRESPONSES[206](
+                headerlist=response.headerlist,
+                content_type=self.content_type, charset=None)
+            response.content_range = (start, end, size)
+            if request.method != 'HEAD':
+                response.app_iter = FileIterable(
+                    self.filename, self.filepath, start, end,
+                    buffer_size=self.buffer_size)
+            response.content_length = end - start
+            return response(environ, start_response)
+
+        self.serve(environ, response, self.filepath, size)
+        return response(environ, start_response)
+
+
+def file_size(fobj):
+    """Returns the size of a file object, which may not be backed by a
+    file descriptor (small uploads are kept in memory).
+    """
+    try:
+        return os.fstat(fobj.fileno()).st_size
+    except (AttributeError, OSError, ValueError):
+        position = fobj.tell()
+        size = fobj.seek(0, os.SEEK_END)
+        fobj.seek(position)
+        return size
+
+
+def hash_factory(hash):
+    """Returns a hash constructor from a constructor or a `hashlib`
+    algorithm name, such as 'sha1', 'sha256' or 'blake2b'.
+    """
+    if isinstance(hash, str):
+        hashlib.new(hash)  # Fails early for unknown algorithms.
+        return partial(hashlib.new, hash)
+    return hash
 
 
-def digest(fobj, hash=hashlib.sha1):
-    hashobj = hash()
-    size = os.fstat(fobj.fileno()).st_size
+def digest(fobj, hash=hashlib.sha1, chunk_size=BUFFERSIZE):
+    hashobj = hash_factory(hash)()
+    size = file_size(fobj)
     hashobj.update(b"blob %i\0" % size)
-    for chunk in chunk_reader(fobj):
+    for chunk in chunk_reader(fobj, chunk_size):
         hashobj.update(chunk)
     fobj.seek(0)
     return hashobj.hexdigest()
 
 
+def digest_files(fobjs, hash=hashlib.sha1, chunk_size=BUFFERSIZE,
+                 workers=None):
+    """Returns the digests of the file objects, computed in parallel by
+    a pool of `workers` threads : hashlib releases the GIL while hashing
+    large buffers.
+    """
+    fobjs = list(fobjs)
+    func = partial(digest, hash=hash_factory(hash), chunk_size=chunk_size)
+    if not workers or workers < 2 or len(fobjs) < 2:
+        return [func(fobj) for fobj in fobjs]
+    with ThreadPoolExecutor(max_workers=min(workers, len(fobjs))) as pool:
+        return list(pool.map(func, fobjs))
+
+
+def copy_digest(fobj, target, hash=hashlib.sha1, chunk_size=BUFFERSIZE):
+    """Copies the file into the target while computing its digest, the
+    same as `digest`, reading the file only once.
+    Returns the digest and the number of bytes copied.
+    """
+    hashobj = hash_factory(hash)()
+    size = file_size(fobj)
+    hashobj.update(b"blob %i\0" % size)
+    copied = 0
+    for chunk in chunk_reader(fobj, chunk_size):
+        hashobj.update(chunk)
+        target.write(chunk)
+        copied += len(chunk)
+    return hashobj.hexdigest(), copied
+
+
 def clean_filename(filename):
     """Borrowed from Werkzeug : http://werkzeug.pocoo.org/
     """
@@ -76,15 +264,92 @@ def clean_filename(filename):
     return filename.translate(remove_punctuation_map)
 
 
-def persist_files(destination, *files):
-    """Document me.
+def spool_file(destination, item, hash=hashlib.sha1, chunk_size=BUFFERSIZE):
+    """Copies the file to a temporary file of the destination, while
+    hashing it. Returns (digest, temporary path, size).
     """
+    tmppath = os.path.join(destination, '.%s.part' % uuid.uuid4().hex)
+    try:
+        with open(tmppath, 'xb') as upload:
+            digested, size = copy_digest(
+                item.file, upload, hash=hash, chunk_size=chunk_size)
+    except BaseException:
+        if os.path.exists(tmppath):
+            os.unlink(tmppath)
+        raise
+    return digested, tmppath, size
+
+
+def spool_files(destination, files, hash=hashlib.sha1,
+                chunk_size=BUFFERSIZE, workers=2):
+    """Spools the files in parallel. If any fails, the spooled files
+    are removed and the error is raised.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(spool_file, destination, item, hash, chunk_size)
+            for item in files]
+    errors = [future.exception() for future in futures
+              if future.exception() is not None]
+    if errors:
+        for future in futures:
+            if future.exception() is None:
+                os.unlink(future.result()[1])
+        raise errors[0]
+    return [future.result() for future in futures]
+
+
+def persist_files(destination, *files, single_pass=False,
+                  hash=hashlib.sha1, chunk_size=BUFFERSIZE, workers=None):
+    """Persists the uploaded files in the destination directory, skipping
+    the duplicates, and yields (digest, filename, size, date) for each
+    persisted file.
+
+    By default, each file is read twice : once to compute its digest,
+    once to copy it. In `single_pass` mode, files are hashed while being
+    copied to a temporary file, renamed once complete, or removed if
+    their digest was already seen.
+
+    The hash can be any `hashlib` constructor or algorithm name. Given
+    `workers`, the files are hashed in parallel by a pool of threads.
+    """
+    hash = hash_factory(hash)
     # digest registry
-    
     digests = set()
 
-    for item in files:
-        digested = digest(item.file)
+    if single_pass:
+        if workers and workers > 1 and len(files) > 1:
+            spooled = spool_files(
+                destination, files, hash, chunk_size, workers)
+        else:
+            spooled = (spool_file(destination, item, hash, chunk_size)
+                       for item in files)
+
+        pending = set()
+        try:
+            for item, (digested, tmppath, size) in zip(files, spooled):
+                pending.add(tmppath)
+                if digested in digests:
+                    continue
+                digests.add(digested)
+                filename = clean_filename(item.filename)
+                os.replace(tmppath, os.path.join(destination, filename))
+                pending.discard(tmppath)
+                yield (digested, filename, size, int(time.time()))
+        finally:
+            # Duplicates and files left over if the iteration stopped.
+            if isinstance(spooled, list):
+                pending.update(tmppath for _, tmppath, _ in spooled)
+            for tmppath in pending:
+                if os.path.exists(tmppath):
+                    os.unlink(tmppath)
+        return
+
+    digested_files = digest_files(
+        (item.file for item in files),
+        hash=hash, chunk_size=chunk_size, workers=workers)
+
+    for item, digested in zip(files, digested_files):
         if digested not in digests:
             digests.add(digested)
             filename = clean_filename(item.filename)
@@ -1,16 +1,21 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
 import json
 import inspect
 from functools import wraps
-from collections import namedtuple, Iterable
+from time import perf_counter
+from collections import namedtuple
+from collections.abc import Iterable
 from jsonschema import Draft4Validator
 
-from webob import Request
+from zope.interface import Invalid
 from zope.schema import getFieldsInOrder, getValidationErrors
-from zope.schema.interfaces import ICollection
+from zope.schema.interfaces import ICollection, IChoice, ValidationError
 
-from .responder import reply
+from .context import RequestContext
+from .metrics import HOOKS, notify
+from .responder import reply, reply_json
 from .definitions import METHODS
 from .components import BaseOverhead, View
 
@@ -34,26 +39,113 @@ def extract_fields(fields, params):
             yield value
 
 
+def make_step(name, field, validate=True):
+    """Returns a callable extracting, converting and validating the
+    value of a field, specialized once for the kind of field.
+    """
+    check = field.validate if validate else (lambda value: None)
+
+    if ICollection.providedBy(field):
+        def step(params):
+            value = params.get(name)
+            if value is not None and not isinstance(value, Iterable):
+                value = [value]
+            check(value)
+            return value
+
+    elif validate and hasattr(field, 'fromUnicode'):
+        fromUnicode = field.fromUnicode
+
+        def step(params):
+            value = params.get(name)
+            if value is None:
+                check(value)
+                return value
+            if (isinstance(value, Iterable) and
+                not isinstance(value, (str, bytes))):
+                value = value[0]
+            # `fromUnicode` validates the converted value.
+            return fromUnicode(value)
+
+    else:
+        def step(params):
+            value = params.get(name)
+            if (value is not None and isinstance(value, Iterable) and
+                not isinstance(value, (str, bytes))):
+                value = value[0]
+            check(value)
+            return value
+
+    return step
+
+
+class ValidationPlan(object):
+    """The fields of an interface, compiled once into a sequence of
+    steps doing the extraction, conversion and validation in a single
+    pass.
+
+    Choices, whose vocabulary may depend on the context, are validated
+    bound to the data, once it is built. Conversion errors are reported
+    as field errors.
+    """
+
+    def __init__(self, iface):
+        self.iface = iface
+        steps = []
+        bound = []
+        for name, field in getFieldsInOrder(iface):
+            if IChoice.providedBy(field):
+                steps.append((name, make_step(name, field, validate=False)))
+                bound.append((name, field))
+            else:
+                steps.append((name, make_step(name, field)))
+        self.steps = tuple(steps)
+        self.bound = tuple(bound)
+        self.invariants = bool(iface.queryTaggedValue('invariants'))
+
+    def __call__(self, params, datacls):
+        values = []
+        errors = []
+        for name, step in self.steps:
+            try:
+                values.append(step(params))
+            except ValidationError as error:
+                errors.append((name, error))
+                values.append(None)
+
+        data = datacls(*values)
+        for name, field in self.bound:
+            value = getattr(data, name)
+            try:
+                field.bind(data).validate(value)
+            except ValidationError as error:
+                errors.append((name, error))
+
+        if self.invariants and not errors:
+            invariant_errors = []
+            try:
+                self.iface.validateInvariants(data, invariant_errors)
+            except Invalid:
+                errors.extend((None, error) for error in invariant_errors)
+        return data, errors
+
+
 def extract_get(environ):
-    request = Request(environ)
-    params = request.GET
-    return params.dict_of_lists()
+    return RequestContext.from_environ(environ).query
 
 
 def extract_put(environ):
-    request = Request(environ)
-    if request.content_type == 'application/json':
-        return request.json
-    params = request.PUT
-    return params.dict_of_lists()
+    context = RequestContext.from_environ(environ)
+    if context.content_type == 'application/json':
+        return context.json
+    return context.form
 
 
 def extract_post(environ):
-    request = Request(environ)
-    if request.content_type == 'application/json':
-        return request.json
-    params = request.POST
-    return params.dict_of_lists()
+    context = RequestContext.from_environ(environ)
+    if context.content_type == 'application/json':
+        return context.json
+    return context.form
 
 
 class validate(object):
@@ -64,10 +156,11 @@ class validate(object):
         'PUT': extract_put,
     }
 
-    def __init__(self, iface, as_dict=False, *sources):
+    def __init__(self, iface, as_dict=False, *sources, compiled=False):
         self.iface = iface
         self.fields = getFieldsInOrder(iface)
         self.as_dict = as_dict
+        self.plan = ValidationPlan(iface) if compiled else None
 
     def extract(self, environ):
         method = environ['REQUEST_METHOD']
@@ -77,22 +170,28 @@ class validate(object):
         return extractor(environ)
 
     def process_action(self, environ, datacls):
-        params = self.extract(environ)            
-        fields = list(extract_fields(self.fields, params))
-        data = datacls(*fields)
-        errors = getValidationErrors(self.iface, data)
-        nb_errors = len(errors)
-    
-        if nb_errors:
+        started = perf_counter() if HOOKS else None
+        params = self.extract(environ)
+        if started is not None:
+            notify('extraction', environ, started)
+            started = perf_counter()
+        if self.plan is not None:
+            data, errors = self.plan(params, datacls)
+        else:
+            fields = list(extract_fields(self.fields, params))
+            data = datacls(*fields)
+            errors = getValidationErrors(self.iface, data)
+        if started is not None:
+            notify('validation', environ, started)
+
+        if errors:
             summary = {}
             for field, error in errors:
                 doc = getattr(error, 'doc', error.__str__)
                 field_errors = summary.setdefault(field, [])
                 field_errors.append(doc())
 
-            return reply(
-                400, text=json.dumps(summary),
-                content_type="application/json")
+            return reply_json(400, summary)
 
         return data
 
@@ -119,19 +218,40 @@ class validate(object):
                     assert isinstance(overhead, BaseOverhead)
                     overhead.set_data(result)
 
-                if inst is not None:
-                    return action(inst, environ, overhead)
-                return action(environ, overhead)
+                started = perf_counter() if HOOKS else None
+                try:
+                    if inst is not None:
+                        return action(inst, environ, overhead)
+                    return action(environ, overhead)
+                finally:
+                    if started is not None:
+                        notify('handler', environ, started)
 
             return result
         return method_validation
 
 
+# Compiled validators, shared by the identical schemas.
+VALIDATORS = {}
+
+
+def compile_schema(schema):
+    """Returns the validator of the schema, compiled once per process.
+    """
+    canonical = json.dumps(schema, sort_keys=True, separators=(',', ':'))
+    key = hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+    validator = VALIDATORS.get(key)
+    if validator is None:
+        validator = VALIDATORS.setdefault(key, Draft4Validator(schema))
+    return validator
+
+
 class JSONSchema(object):
 
     def __init__(self, schema, schema_string):
         self.string = schema_string
         self.schema = json.loads(schema_string)
+        self.validator = compile_schema(self.schema)
 
     @classmethod
     def create_from_string(cls, string):
@@ -143,10 +263,14 @@ class JSONSchema(object):
         string = json.dumps(schema)
         return cls(schema, string)
 
+    def is_valid(self, obj):
+        return self.validator.is_valid(obj)
+
     def validate(self, obj):
         errors = {}
-        validator = Draft4Validator(self.schema)
-        for error in sorted(validator.iter_errors(obj), key=str):
+        if self.validator.is_valid(obj):
+            return errors
+        for error in sorted(self.validator.iter_errors(obj), key=str):
             if 'required' in error.schema_path:
                 causes = ['__missing__']
             elif error.path:
@@ -162,16 +286,14 @@ class JSONSchema(object):
         @wraps(method)
         def validate_method(inst, environ, overhead):
             assert isinstance(overhead, BaseOverhead)
-            request = Request(environ)
-            
-            if request.content_type != 'application/json':
+            context = RequestContext.from_environ(environ)
+
+            if context.content_type != 'application/json':
                 return reply(406, text="Content type must be application/json")
 
-            errors = self.validate(request.json)
+            errors = self.validate(context.json)
             if errors:
-                return reply(
-                    400, text=json.dumps(errors),
-                    content_type='application/json')
-            overhead.set_data(request.json)
+                return reply_json(400, errors)
+            overhead.set_data(context.json)
             return method(inst, environ, overhead)
         return validate_method